@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models.funnel_step import FunnelStep
+from models.matrix_cache import MatrixCacheEntry
+from models.persona import Persona
+from models.variant import Variant
+from engine import matrix_cache
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/matrix-cache")
+def list_matrix_cache(db: Session = Depends(get_db)):
+    entries = db.query(MatrixCacheEntry).order_by(MatrixCacheEntry.last_used_at.desc()).all()
+    return [
+        {
+            "key": e.key,
+            "model": e.model,
+            "pairs": len(e.scores),
+            "hits": e.hits,
+            "created_at": e.created_at,
+            "last_used_at": e.last_used_at,
+        }
+        for e in entries
+    ]
+
+
+@router.delete("/matrix-cache")
+def clear_matrix_cache(db: Session = Depends(get_db)):
+    removed = db.query(MatrixCacheEntry).delete()
+    db.commit()
+    return {"removed": removed}
+
+
+@router.delete("/matrix-cache/{key}")
+def invalidate_matrix_cache_entry(key: str, db: Session = Depends(get_db)):
+    removed = db.query(MatrixCacheEntry).filter(MatrixCacheEntry.key == key).delete()
+    db.commit()
+    if not removed:
+        raise HTTPException(status_code=404, detail="Cache entry not found")
+    return {"removed": removed}
+
+
+@router.post("/matrix-cache/prewarm")
+def prewarm_matrix_cache(db: Session = Depends(get_db)):
+    """Score the current personas and active variants so the next run starts on a cache hit."""
+    personas = db.query(Persona).all()
+    steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
+    variants = db.query(Variant).filter(Variant.is_active == True).all()
+    matrix, info = matrix_cache.get_conversion_matrix(db, personas, steps, variants)
+    return {"pairs": len(matrix), **info}
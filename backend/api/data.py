@@ -1,86 +1,340 @@
-from typing import Optional
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Literal, Optional, Tuple
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 
 from database import get_db
+from config import EVENTS_COUNT_TTL, EVENTS_COUNT_CACHE_SIZE
 from models.event import Event
 from models.variant import Variant
 from models.bandit_state import BanditState
+from models.run_bandit_state import RunBanditState
 from models.funnel_step import FunnelStep
 from models.persona import Persona
+from models.run_rollup import RunRollup
+from models.simulation_run import SimulationRun
+from engine.archive import archive_run, open_archive
+from engine.simulation import get_run_state
+from engine.export import EXPORT_MEDIA_TYPES, export_events
 
 router = APIRouter(prefix="/api/data", tags=["data"])
 
 
 @router.get("/stats")
 def get_stats(run_id: Optional[int] = None, db: Session = Depends(get_db)):
-    """Per-step, per-variant conversion rates."""
-    steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
+    """Per-step, per-variant conversion rates.
+    With run_id, counts come from that run's rollups and include a per-persona breakdown, and
+    posteriors from the run's own bandit state; without it, everything comes from the global
+    bandit states. Either way it is a single query."""
+    if run_id is None:
+        rows = (
+            db.query(FunnelStep, Variant, BanditState)
+            .join(Variant, Variant.step_id == FunnelStep.id)
+            .outerjoin(BanditState, BanditState.variant_id == Variant.id)
+            .order_by(FunnelStep.step_number, Variant.id)
+            .all()
+        )
+        return _group_stats(((step, v, bs, None) for step, v, bs in rows), per_run=False)
+
+    # Each variant's persona rollups folded into one JSON array of [persona_id, exposures,
+    # conversions], looked up on the (run_id, step_id, variant_id) prefix of the unique index,
+    # so the query returns one row per variant as the global one does.
+    personas = (
+        db.query(func.json_group_array(func.json_array(RunRollup.persona_id, RunRollup.exposures,
+                                                       RunRollup.conversions)))
+        .filter(RunRollup.run_id == run_id, RunRollup.step_id == Variant.step_id,
+                RunRollup.variant_id == Variant.id)
+        .correlate(Variant)
+        .scalar_subquery()
+    )
+    rows = (
+        db.query(FunnelStep, Variant, RunBanditState, personas)
+        .join(Variant, Variant.step_id == FunnelStep.id)
+        .outerjoin(RunBanditState, (RunBanditState.variant_id == Variant.id) & (RunBanditState.run_id == run_id))
+        .order_by(FunnelStep.step_number, Variant.id)
+        .all()
+    )
+    return _group_stats(rows, per_run=True)
+
+
+def _group_stats(rows, per_run: bool) -> list:
+    """Fold (step, variant, bandit_state, personas) rows into the nested stats shape, where
+    personas is the variant's rollups as a JSON array of [persona_id, exposures, conversions]
+    (None for global stats).
+    Per run, bandit_state is the run's RunBanditState and only supplies the posterior;
+    counts are summed from the rollups."""
     result = []
-    for step in steps:
-        variants = db.query(Variant).filter(Variant.step_id == step.id).all()
-        variant_stats = []
-        for v in variants:
-            bs = db.query(BanditState).filter(BanditState.variant_id == v.id).first()
-            variant_stats.append({
+    steps = {}
+    variants = {}
+    for step, v, bs, personas in rows:
+        if step.id not in steps:
+            steps[step.id] = {
+                "step_id": step.id,
+                "step_number": step.step_number,
+                "step_name": step.name,
+                "exposures": 0,
+                "conversions": 0,
+                "variants": [],
+            }
+            result.append(steps[step.id])
+        step_stats = steps[step.id]
+
+        if v.id not in variants:
+            variants[v.id] = {
                 "variant_id": v.id,
                 "generation": v.generation,
                 "content": v.content,
                 "features": v.features,
                 "is_active": v.is_active,
-                "exposures": bs.exposures if bs else 0,
-                "conversions": bs.conversions if bs else 0,
-                "rate": round(bs.rate, 4) if bs else 0.0,
+                "exposures": bs.exposures if bs and not per_run else 0,
+                "conversions": bs.conversions if bs and not per_run else 0,
+                "rate": round(bs.rate, 4) if bs and not per_run else 0.0,
                 "alpha": bs.alpha if bs else 1.0,
                 "beta": bs.beta_param if bs else 1.0,
+            }
+            if per_run:
+                variants[v.id]["personas"] = []
+                variants[v.id]["has_run_state"] = bs is not None
+            step_stats["variants"].append(variants[v.id])
+            step_stats["exposures"] += variants[v.id]["exposures"]
+            step_stats["conversions"] += variants[v.id]["conversions"]
+        variant_stats = variants[v.id]
+
+        for persona_id, exposures, conversions in sorted(json.loads(personas)) if personas else ():
+            variant_stats["personas"].append({
+                "persona_id": persona_id,
+                "exposures": exposures,
+                "conversions": conversions,
+                "rate": round(conversions / exposures, 4) if exposures else 0.0,
             })
-        result.append({
-            "step_id": step.id,
-            "step_number": step.step_number,
-            "step_name": step.name,
-            "variants": variant_stats,
-        })
+            variant_stats["exposures"] += exposures
+            variant_stats["conversions"] += conversions
+            step_stats["exposures"] += exposures
+            step_stats["conversions"] += conversions
+
+    if per_run:
+        for variant_stats in variants.values():
+            exp, conv = variant_stats["exposures"], variant_stats["conversions"]
+            variant_stats["rate"] = round(conv / exp, 4) if exp else 0.0
+            if not variant_stats.pop("has_run_state"):
+                # runs from before per-run bandit state: reconstruct from counts
+                variant_stats["alpha"] = 1.0 + conv
+                variant_stats["beta"] = 1.0 + exp - conv
     return result
 
 
+def _encode_cursor(run_id: int, last_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{run_id}:{last_id}".encode()).decode().rstrip("=")
+
+
+def _decode_cursor(run_id: int, cursor: str) -> int:
+    """The id to page before. Cursors are opaque to clients and bound to their run."""
+    try:
+        cursor_run, last_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        if int(cursor_run) == run_id:
+            return int(last_id)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _filter_events(query, filters: dict, model=Event):
+    for field, value in filters.items():
+        if field == "user_min":
+            query = query.filter(model.user_number >= value)
+        elif field == "user_max":
+            query = query.filter(model.user_number <= value)
+        else:
+            query = query.filter(getattr(model, field) == value)
+    return query
+
+
+# (run_id, source, filters) -> (expires_at, total), least recently used first. Sync endpoints
+# run in the threadpool, so every access goes through _count_lock.
+_count_cache: OrderedDict[tuple, Tuple[float, int]] = OrderedDict()
+_count_lock = threading.Lock()
+
+
+def _events_total(db: Session, run_id: int, filters: dict, archive) -> Tuple[int, str]:
+    """Total matching events without counting the events table on every page.
+    Step, variant, persona and converted filters are answered from the run's rollups, which
+    the event sink updates in the same transaction as the events. user_number ranges are
+    counted once and reused for EVENTS_COUNT_TTL seconds."""
+    if archive is not None and not filters:
+        return archive.rows, "archive"
+    if "user_min" not in filters and "user_max" not in filters:
+        query = _filter_events(
+            db.query(func.sum(RunRollup.exposures), func.sum(RunRollup.conversions)).filter(RunRollup.run_id == run_id),
+            {f: v for f, v in filters.items() if f != "converted"},
+            model=RunRollup,
+        )
+        exposures, conversions = query.one()
+        if exposures is not None:
+            if "converted" not in filters:
+                return exposures, "rollup"
+            return (conversions if filters["converted"] else exposures - conversions), "rollup"
+
+    key = (run_id, "archive" if archive is not None else "db", tuple(sorted(filters.items())))
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None and cached[0] > now:
+            _count_cache.move_to_end(key)
+            return cached[1], "cache"
+    if archive is not None:
+        total = archive.count(filters)
+    else:
+        total = _filter_events(db.query(func.count(Event.id)).filter(Event.run_id == run_id), filters).scalar()
+    with _count_lock:  # counted outside the lock; a concurrent miss just stores the same total
+        _count_cache[key] = (now + EVENTS_COUNT_TTL, total)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > EVENTS_COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return total, "count"
+
+
 @router.get("/events")
 def get_events(
     run_id: int,
+    cursor: Optional[str] = None,
     offset: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    step_id: Optional[int] = None,
+    variant_id: Optional[int] = None,
+    persona_id: Optional[int] = None,
+    converted: Optional[bool] = None,
+    user_min: Optional[int] = Query(None, ge=0),
+    user_max: Optional[int] = Query(None, ge=0),
+    source: Literal["auto", "db", "archive"] = "auto",
     db: Session = Depends(get_db),
 ):
-    """Paginated event log."""
-    events = (
-        db.query(Event)
-        .filter(Event.run_id == run_id)
-        .order_by(Event.id.desc())
-        .offset(offset)
-        .limit(limit)
-        .all()
-    )
-    total = db.query(func.count(Event.id)).filter(Event.run_id == run_id).scalar()
+    """Event log, newest first. Pass the previous page's next_cursor to continue: pages are
+    keyed on (run_id, id), so deep pages cost the same as the first. offset still works but
+    scans the skipped rows. "auto" serves finished runs from the columnar archive."""
+    filters = {
+        f: v for f, v in (
+            ("step_id", step_id), ("variant_id", variant_id), ("persona_id", persona_id),
+            ("converted", converted), ("user_min", user_min), ("user_max", user_max),
+        ) if v is not None
+    }
+    before_id = _decode_cursor(run_id, cursor) if cursor else None
+
+    archive = open_archive(run_id) if source != "db" else None
+    if archive is not None and (archive.complete or source == "archive"):
+        page = archive.page_before(before_id, limit, filters, skip=offset)
+        rows = zip(*(page[f].tolist() for f in
+                     ("id", "user_number", "persona_id", "step_id", "variant_id", "converted", "match_score")))
+        served_from = "archive"
+    elif source == "archive":
+        raise HTTPException(status_code=404, detail="Run not archived")
+    else:
+        archive = None
+        query = _filter_events(db.query(Event).filter(Event.run_id == run_id), filters)
+        if before_id is not None:
+            query = query.filter(Event.id < before_id)
+        rows = (
+            (e.id, e.user_number, e.persona_id, e.step_id, e.variant_id, e.converted, e.match_score)
+            for e in query.order_by(Event.id.desc()).offset(offset).limit(limit)
+        )
+        served_from = "db"
+
+    events = [
+        {
+            "id": i,
+            "user_number": u,
+            "persona_id": p,
+            "step_id": s,
+            "variant_id": v,
+            "converted": c,
+            "match_score": round(m, 3),
+        }
+        for i, u, p, s, v, c, m in rows
+    ]
+    total, total_source = _events_total(db, run_id, filters, archive)
     return {
         "total": total,
+        "total_source": total_source,  # archive | rollup | cache | count
         "offset": offset,
         "limit": limit,
-        "events": [
-            {
-                "id": e.id,
-                "user_number": e.user_number,
-                "persona_id": e.persona_id,
-                "step_id": e.step_id,
-                "variant_id": e.variant_id,
-                "converted": e.converted,
-                "match_score": round(e.match_score, 3),
-            }
-            for e in events
-        ],
+        "source": served_from,
+        "next_cursor": _encode_cursor(run_id, events[-1]["id"]) if len(events) == limit else None,
+        "events": events,
     }
 
 
+@router.get("/export")
+def export_run_events(
+    run_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    names: bool = False,
+    gzip: bool = False,
+    source: Literal["auto", "db", "archive"] = "auto",
+    db: Session = Depends(get_db),
+):
+    """Stream a run's whole event log, oldest first. names adds persona and step names;
+    gzip compresses on the fly. "auto" serves finished runs from the columnar archive."""
+    if db.get(SimulationRun, run_id) is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    archive = open_archive(run_id) if source != "db" else None
+    if source == "archive" and archive is None:
+        raise HTTPException(status_code=404, detail="Run not archived")
+    if archive is not None and not (archive.complete or source == "archive"):
+        archive = None
+
+    filename = f"run_{run_id}_events.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_events(run_id, format, names=names, compress=gzip, archive=archive),
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/aggregates")
+def get_aggregates(run_id: int, by_persona: bool = False, db: Session = Depends(get_db)):
+    """Exposures and conversions per step x variant (x persona) for one run."""
+    archive = open_archive(run_id)
+    if archive is not None and archive.complete:
+        return {"source": "archive", "groups": archive.aggregate(by_persona)}
+
+    keys = [Event.step_id, Event.variant_id] + ([Event.persona_id] if by_persona else [])
+    rows = (
+        db.query(*keys, func.count(Event.id), func.sum(Event.converted))
+        .filter(Event.run_id == run_id)
+        .group_by(*keys)
+        .order_by(*keys)
+        .all()
+    )
+    groups = []
+    for row in rows:
+        exposures, conversions = row[-2], int(row[-1] or 0)
+        entry = {"step_id": row[0], "variant_id": row[1], "exposures": exposures, "conversions": conversions,
+                 "rate": round(conversions / exposures, 4) if exposures else 0.0}
+        if by_persona:
+            entry["persona_id"] = row[2]
+        groups.append(entry)
+    return {"source": "db", "groups": groups}
+
+
+@router.post("/archive")
+def create_archive(run_id: int, db: Session = Depends(get_db)):
+    """Archive a finished run's events into the columnar store (resumes a partial archive).
+    Active runs are refused: finalizing would mark a partial archive complete, and the
+    live-archive writer may be appending to it."""
+    run = db.get(SimulationRun, run_id)
+    if run is None:
+        return {"error": "Run not found"}
+    if get_run_state(run_id) or run.status in ("pending", "running"):
+        return {"error": "Run still active"}
+    return {"run_id": run_id, "rows": archive_run(run_id)}
+
+
 @router.get("/variants")
 def get_variants(step_id: Optional[int] = None, db: Session = Depends(get_db)):
     """Get variants, optionally filtered by step."""
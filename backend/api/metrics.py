@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from config import METRICS_ENABLED
+from engine.metrics import REGISTRY
+
+router = APIRouter(prefix="/api/metrics", tags=["metrics"])
+
+
+@router.get("", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text exposition of stage timings and per-run counters."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
@@ -1,12 +1,31 @@
-from fastapi import APIRouter, Depends
-from pydantic import BaseModel
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from sse_starlette.sse import EventSourceResponse
 
 from database import get_db
-from config import DEFAULT_TOTAL_USERS, DEFAULT_POPULATION_MIX, DEFAULT_AGENT_TRIGGER_INTERVAL
+from config import (
+    DEFAULT_TOTAL_USERS,
+    DEFAULT_POPULATION_MIX,
+    DEFAULT_AGENT_TRIGGER_INTERVAL,
+    DEFAULT_BATCH_SIZE,
+    CONVERGENCE_EVERY_USERS,
+    DEFAULT_CONVERGENCE_THRESHOLD,
+    SWEEP_MAX_CONFIGS,
+    REPLICATE_MAX,
+    REPLICATE_BATCH_SIZE,
+)
 from models.simulation_run import SimulationRun
-from engine.simulation import run_simulation, get_run_state
+from engine.simulation import get_run_state
+from engine.bandit import promote_run_state
+from engine.rng import new_seed
+from engine.runner import scheduler
+from engine.stream import StreamFormat, encode_stream
+from engine.sweep import load_setup, expand_grid, run_sweep
+from engine.replicates import run_replicates
 
 router = APIRouter(prefix="/api/simulation", tags=["simulation"])
 
@@ -14,7 +33,32 @@ router = APIRouter(prefix="/api/simulation", tags=["simulation"])
 class StartRequest(BaseModel):
     total_users: int = DEFAULT_TOTAL_USERS
     population_mix: dict = DEFAULT_POPULATION_MIX
-    agent_trigger_interval: int = DEFAULT_AGENT_TRIGGER_INTERVAL
+    agent_trigger_interval: int = Field(DEFAULT_AGENT_TRIGGER_INTERVAL, ge=0)  # 0 disables the hypothesis agent
+    mode: Literal["stream", "turbo"] = "stream"
+    batch_size: int = Field(DEFAULT_BATCH_SIZE, ge=1)
+    prior: Literal["global", "fresh"] = "global"  # starting posteriors for the run's own bandit state
+    convergence_every: int = Field(CONVERGENCE_EVERY_USERS, ge=1)
+    convergence_threshold: float = Field(DEFAULT_CONVERGENCE_THRESHOLD, gt=0.5, lt=1.0)
+    auto_stop: bool = False  # end the run once every step's leader clears the threshold
+    seed: Optional[int] = Field(None, ge=0)  # fixed seed for a reproducible run; random when omitted
+
+
+class SweepRequest(BaseModel):
+    """Each list is one grid axis; the sweep runs every combination."""
+    total_users: list[int] = Field([DEFAULT_TOTAL_USERS], min_length=1)
+    population_mix: list[dict] = Field([DEFAULT_POPULATION_MIX], min_length=1)
+    noise: list[float] = Field([0.08], min_length=1)
+    batch_size: int = Field(DEFAULT_BATCH_SIZE, ge=1)
+    seed: Optional[int] = Field(None, ge=0)
+
+
+class ReplicateRequest(BaseModel):
+    total_users: int = Field(DEFAULT_TOTAL_USERS, ge=1)
+    population_mix: dict = DEFAULT_POPULATION_MIX
+    noise: float = 0.08
+    batch_size: int = Field(REPLICATE_BATCH_SIZE, ge=1)
+    replicates: int = Field(100, ge=1, le=REPLICATE_MAX)
+    seed: Optional[int] = Field(None, ge=0)
 
 
 class SpeedRequest(BaseModel):
@@ -32,16 +76,82 @@ def start_simulation(req: StartRequest, db: Session = Depends(get_db)):
         total_users=req.total_users,
         population_mix=req.population_mix,
         agent_trigger_interval=req.agent_trigger_interval,
+        mode=req.mode,
+        batch_size=req.batch_size,
+        prior=req.prior,
+        convergence_every=req.convergence_every,
+        convergence_threshold=req.convergence_threshold,
+        auto_stop=req.auto_stop,
+        seed=req.seed if req.seed is not None else new_seed(),
     )
     db.add(run)
     db.commit()
     db.refresh(run)
-    return {"run_id": run.id, "status": run.status}
+    try:
+        scheduler.start(run.id)
+    except RuntimeError as e:
+        run.status = "rejected"
+        db.commit()
+        return {"error": str(e), "run_id": run.id, "status": run.status}
+    return {"run_id": run.id, "status": run.status, "seed": run.seed}
 
 
 @router.get("/{run_id}/stream")
-async def stream_simulation(run_id: int):
-    return EventSourceResponse(run_simulation(run_id))
+def stream_simulation(
+    run_id: int,
+    format: StreamFormat = "json",
+    last_event_id: Optional[int] = Header(None),
+    db: Session = Depends(get_db),
+):
+    """Subscribe to a run. Any number of clients share the one running simulation;
+    EventSource's automatic Last-Event-ID header resumes right after the last seen message.
+    A plain def, so the lookup and a possible worker start run in the threadpool, not on the loop."""
+    worker = scheduler.get(run_id)
+    if worker is None:
+        run = db.query(SimulationRun).get(run_id)
+        if run is None or run.status != "pending":
+            return EventSourceResponse(encode_stream(_single({"type": "error", "message": "Run not active"}), format))
+        worker = scheduler.start(run_id)  # pending run whose worker was lost, e.g. across a restart
+    return EventSourceResponse(encode_stream(worker.broadcaster.subscribe(last_event_id or 0), format))
+
+
+async def _single(message: dict):
+    yield None, message
+
+
+@router.post("/sweep")
+async def sweep_simulation(
+    req: SweepRequest,
+    format: StreamFormat = "json",
+    db: Session = Depends(get_db),
+):
+    """Run a grid of headless simulations across worker processes, streaming each result as it lands."""
+    configs = expand_grid({
+        "total_users": req.total_users,
+        "population_mix": req.population_mix,
+        "noise": req.noise,
+        "batch_size": [req.batch_size],
+    })
+    if len(configs) > SWEEP_MAX_CONFIGS:
+        return {"error": f"Sweep expands to {len(configs)} configs (max {SWEEP_MAX_CONFIGS})"}
+    setup = await run_in_threadpool(load_setup, db)
+    seed = req.seed if req.seed is not None else new_seed()
+    return EventSourceResponse(encode_stream(_framed(run_sweep(setup, configs, seed)), format))
+
+
+@router.post("/replicates")
+async def replicate_simulation(req: ReplicateRequest, db: Session = Depends(get_db)):
+    """Run many independent replicates of one configuration and return distributions of
+    cumulative regret, users-to-convergence and final allocation per variant."""
+    setup = await run_in_threadpool(load_setup, db)
+    config = req.model_dump(exclude={"replicates", "seed"})
+    seed = req.seed if req.seed is not None else new_seed()
+    return await run_replicates(setup, config, req.replicates, seed)
+
+
+async def _framed(messages):
+    async for message in messages:
+        yield None, message
 
 
 @router.post("/{run_id}/pause")
@@ -71,6 +181,24 @@ def stop_simulation(run_id: int):
     return {"status": "stopping"}
 
 
+@router.post("/{run_id}/promote")
+def promote_run(run_id: int, db: Session = Depends(get_db)):
+    """Merge a finished run's learned bandit state into the global posteriors."""
+    run = db.query(SimulationRun).get(run_id)
+    if not run:
+        return {"error": "Run not found"}
+    if get_run_state(run_id):
+        return {"error": "Run still active"}
+    if run.status not in ("completed", "stopped", "converged"):
+        return {"error": f"Run is {run.status}, only finished runs can be promoted"}
+    if run.promoted:
+        return {"error": "Run already promoted"}
+    updated = promote_run_state(db, run_id)
+    run.promoted = True
+    db.commit()
+    return {"run_id": run_id, "promoted": True, "variants_updated": updated}
+
+
 @router.patch("/{run_id}/speed")
 def set_speed(run_id: int, req: SpeedRequest):
     state = get_run_state(run_id)
@@ -87,4 +215,7 @@ def set_population_mix(run_id: int, req: PopulationMixRequest, db: Session = Dep
         return {"error": "Run not found"}
     run.population_mix = req.population_mix
     db.commit()
+    state = get_run_state(run_id)
+    if state:
+        state["population_mix"] = dict(req.population_mix)  # picked up on the run's next tick
     return {"population_mix": run.population_mix}
@@ -0,0 +1,59 @@
+"""
+Benchmark suite for the simulation, bandit and data-API hot paths. Run from backend/:
+
+    python -m bench run [--quick] [--save bench/baselines/<name>.json]
+    python -m bench compare bench/baselines/<name>.json <results>.json [--threshold 0.15]
+
+`run` uses a throwaway SQLite database and archive directory and the dot-product matrix,
+so it needs neither an API key nor an existing converge.db. `compare` exits non-zero when
+any benchmark is slower than the baseline by more than the threshold.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run the suite")
+    run.add_argument("--quick", action="store_true", help="smaller scales and shorter timings")
+    run.add_argument("--save", type=Path, help="write results to this JSON file")
+    cmp = sub.add_parser("compare", help="compare results against a baseline")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        from bench.compare import compare
+
+        lines, regressions = compare(args.baseline, args.current, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+        return 0
+
+    tmp = tempfile.mkdtemp(prefix="converge-bench-")
+    os.environ["CONVERGE_DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["CONVERGE_DATA_DIR"] = tmp
+    os.environ["ANTHROPIC_API_KEY"] = ""  # always the dot-product matrix
+    try:
+        from bench.harness import environment, save
+        from bench.suite import run_suite
+
+        results = run_suite(quick=args.quick)
+        if args.save:
+            save(args.save, results, {**environment(), "quick": args.quick})
+            print(f"[bench] saved {len(results)} results to {args.save}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Compare two result files and flag regressions. Every metric is a rate, so higher is better."""
+from typing import List, Tuple
+
+from bench.harness import load
+
+
+def compare(baseline_path: str, current_path: str, threshold: float = 0.15) -> Tuple[List[str], List[str]]:
+    """Return (report lines, names of benchmarks slower than baseline by more than threshold)."""
+    baseline = load(baseline_path)["results"]
+    current = load(current_path)["results"]
+    lines = [f"{'benchmark':<48} {'baseline':>14} {'current':>14} {'change':>9}"]
+    regressions = []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            lines.append(f"{name:<48} {'only in ' + ('current' if name in current else 'baseline'):>39}")
+            continue
+        old, new = baseline[name]["rate"], current[name]["rate"]
+        change = new / old - 1.0 if old else 0.0
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif change > threshold:
+            flag = "  faster"
+        lines.append(f"{name:<48} {old:>14,.1f} {new:>14,.1f} {change:>+8.1%}{flag}")
+    return lines, regressions
@@ -0,0 +1,47 @@
+"""Timing and result-file helpers for the benchmark suite. Imports nothing from the app."""
+import json
+import platform
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Best-of-`repeat` per-call time of fn, with the loop count calibrated to take ~min_time."""
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    loops = max(1, int(loops * min_time / 0.2))
+    best = min(timer.repeat(repeat=repeat, number=loops)) / loops
+    return {"rate": round(1.0 / best, 2), "unit": "ops/s", "us_per_op": round(best * 1e6, 3), "loops": loops}
+
+
+def measure_once(fn: Callable[[], int]) -> dict:
+    """Time one long call; fn returns how many units (e.g. users) it processed."""
+    started = time.perf_counter()
+    units = fn()
+    elapsed = time.perf_counter() - started
+    return {"rate": round(units / elapsed, 2), "unit": "users/s", "elapsed_sec": round(elapsed, 3), "units": units}
+
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def save(path: Path, results: dict, meta: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"meta": meta, "results": results}, indent=2, sort_keys=True) + "\n")
+
+
+def load(path: Path) -> dict:
+    return json.loads(Path(path).read_text())
@@ -0,0 +1,123 @@
+"""
+The benchmarks themselves. Import only after bench/__main__.py has pointed
+CONVERGE_DATABASE_URL and CONVERGE_DATA_DIR at a temp directory.
+"""
+import asyncio
+from itertools import cycle
+from typing import Callable, Dict
+
+import numpy as np
+
+from database import SessionLocal, migrate_schema
+from seed import seed_database
+from config import DEFAULT_POPULATION_MIX
+from models.persona import Persona
+from models.funnel_step import FunnelStep
+from models.variant import Variant
+from models.bandit_state import BanditState
+from models.simulation_run import SimulationRun
+from engine import simulation
+from engine.bandit import load_bandit_store, thompson_select, update_bandit
+from engine.conversion import FEATURE_DIMS, simulate_conversion_with_matrix
+from engine.event_sink import EventSink
+from engine.personas import PersonaRegistry
+from engine.rng import RunRNG
+from engine.scorer import score_with_features
+from api.data import get_stats
+from bench.harness import measure, measure_once
+
+SCALES = [2, 20, 200, 2000]
+QUICK_SCALES = [2, 20, 200]
+
+
+def scale_variants(db, per_step: int, rng: np.random.Generator) -> None:
+    """Top every funnel step up to per_step active variants, each with a global bandit row."""
+    for step in db.query(FunnelStep).all():
+        have = db.query(Variant).filter(Variant.step_id == step.id).count()
+        new = [
+            Variant(step_id=step.id, generation=0, content={"headline": f"Bench variant {step.id}-{i}"},
+                    features={d: round(float(x), 2) for d, x in zip(FEATURE_DIMS, rng.random(len(FEATURE_DIMS)))})
+            for i in range(have, per_step)
+        ]
+        db.add_all(new)
+        db.flush()
+        db.add_all(BanditState(variant_id=v.id) for v in new)
+    db.commit()
+
+
+def _new_run(db, total_users: int, **kwargs) -> int:
+    run = SimulationRun(status="pending", total_users=total_users, population_mix=DEFAULT_POPULATION_MIX,
+                        prior="fresh", seed=1, **kwargs)
+    db.add(run)
+    db.commit()
+    return run.id
+
+
+def micro(db, per_step: int, results: Dict[str, dict], quick: bool) -> None:
+    rng = RunRNG(per_step)
+    personas = db.query(Persona).all()
+    steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
+    variants = db.query(Variant).filter(Variant.is_active == True).all()
+    store = load_bandit_store(db, rng=rng)
+    matrix = score_with_features(personas, variants)
+    step_id = steps[0].id
+    variant_ids = cycle(store.arms[step_id].variant_ids.tolist())
+    outcomes = cycle([True, False, False])
+    pairs = cycle([(p.name, v.id) for p in personas for v in variants[:50]])
+    min_time = 0.05 if quick else 0.2
+
+    def record(name: str, fn: Callable[[], object]) -> None:
+        results[f"micro.{name}[v={per_step}]"] = measure(fn, repeat=3 if quick else 5, min_time=min_time)
+        print(f"[bench] {name} v={per_step}: {results[f'micro.{name}[v={per_step}]']['us_per_op']} us/op")
+
+    record("thompson_select", lambda: thompson_select(store, step_id))
+    record("update_bandit", lambda: update_bandit(store, next(variant_ids), next(outcomes)))
+    record("simulate_conversion_with_matrix",
+           lambda: simulate_conversion_with_matrix(*next(pairs), matrix, rng=rng))
+    registry = PersonaRegistry(personas)
+    record("_sample_persona", lambda: simulation._sample_persona(registry, DEFAULT_POPULATION_MIX, rng))
+
+    run_id = _new_run(db, total_users=10**9)
+    sink = EventSink(run_id)
+    users = iter(range(1, 10**9))
+    record("simulate_user", lambda: simulation.simulate_user(steps, registry, DEFAULT_POPULATION_MIX, next(users),
+                                                             matrix, store, sink, rng))
+    sink.close()
+
+    record("get_stats", lambda: get_stats(None, db))
+    record("get_stats_run", lambda: get_stats(run_id, db))
+
+
+async def _drain(run_id: int) -> int:
+    """Drive run_simulation to the end with throttling disabled; returns users simulated."""
+    total = 0
+    async for message in simulation.run_simulation(run_id):
+        if message["type"] == "sim_started":
+            simulation.get_run_state(run_id)["speed"] = 10**9
+        elif message["type"] == "sim_ended":
+            total = message["total_users"]
+    return total
+
+
+def macro(db, results: Dict[str, dict], quick: bool) -> None:
+    for mode, users in (("stream", 300 if quick else 2000), ("turbo", 20_000 if quick else 200_000)):
+        run_id = _new_run(db, total_users=users, mode=mode, batch_size=1000)
+        name = f"macro.run_simulation.{mode}"
+        results[name] = measure_once(lambda: asyncio.run(_drain(run_id)))
+        print(f"[bench] {name}: {results[name]['rate']:,.0f} users/s")
+
+
+def run_suite(quick: bool = False) -> Dict[str, dict]:
+    migrate_schema()
+    seed_database()
+    results: Dict[str, dict] = {}
+    db = SessionLocal()
+    try:
+        macro(db, results, quick)  # on the seeded funnel, before the variant counts grow
+        feature_rng = np.random.default_rng(0)
+        for per_step in QUICK_SCALES if quick else SCALES:
+            scale_variants(db, per_step, feature_rng)
+            micro(db, per_step, results, quick)
+    finally:
+        db.close()
+    return results
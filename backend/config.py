@@ -6,14 +6,95 @@ load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "converge.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+DATA_DIR = Path(os.environ.get("CONVERGE_DATA_DIR", BASE_DIR / "data"))
+ARCHIVE_DIR = DATA_DIR / "archive"
+# Overridable so the benchmark suite (bench/) can point everything at a throwaway database
+DATABASE_URL = os.environ.get("CONVERGE_DATABASE_URL", f"sqlite:///{DB_PATH}")
+
+# SQLite storage profiles, applied as PRAGMAs on every new connection.
+# "wal" lets API readers run alongside the simulation writer.
+STORAGE_PROFILES = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MB
+        "cache_size": -65536,  # negative = KiB, so 64 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "default": {},
+}
+STORAGE_PROFILE = os.getenv("CONVERGE_STORAGE_PROFILE", "wal")
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY", "")
+SCORER_MODEL = "claude-haiku-4-5-20251001"
+SCORER_TIMEOUT = 20.0  # seconds before a run gives up on Claude and keeps the dot-product matrix
+
+# Hypothesis agent (see engine/agent.py)
+AGENT_MODEL = os.getenv("CONVERGE_AGENT_MODEL", SCORER_MODEL)  # "stub" = deterministic offline model
+AGENT_TIMEOUT = 30.0  # seconds before an analysis is abandoned; the run never waits on it
+AGENT_MAX_CONCURRENT = 2  # analyses in flight per run
+AGENT_CACHE_SIZE = 256  # model responses kept, keyed by prompt hash
+AGENT_MAX_NEW_VARIANTS = 2  # variants accepted from one analysis
+AGENT_MAX_ACTIVE_VARIANTS = 8  # steps at this many active variants are not analyzed again
+AGENT_MIN_EXPOSURES = 50  # generated variants need this many exposures for a hypothesis verdict
+
+# Conversion matrix cache (see engine/matrix_cache.py)
+MATRIX_CACHE_MAX_ENTRIES = 64  # least recently used entries beyond this are evicted
+MATRIX_CACHE_TTL_DAYS = 30  # entries older than this are evicted regardless of use
 
 # Simulation defaults
 DEFAULT_USERS_PER_SEC = 5
 DEFAULT_TOTAL_USERS = 500
-DEFAULT_AGENT_TRIGGER_INTERVAL = 100  # trigger agent every N users
+DEFAULT_AGENT_TRIGGER_INTERVAL = 100  # trigger agent every N users reaching a step; 0 disables it
+DEFAULT_BATCH_SIZE = 1000  # users per vectorized tick in turbo mode
+BANDIT_CHECKPOINT_INTERVAL = 50  # persist in-memory bandit arrays every N users
+
+RNG_PREFETCH = 65536  # uniforms drawn per refill of a run's prefetch buffer (see engine/rng.py)
+
+# bandit_snapshot coalescing on the SSE stream (see engine/snapshots.py)
+SNAPSHOT_EVERY_USERS = 10  # emit at least every N users...
+SNAPSHOT_INTERVAL_MS = 250  # ...or every T ms, whichever comes first
+SNAPSHOT_KEYFRAME_EVERY = 20  # every Kth snapshot carries all variants, not just changed ones
+
+# Online convergence metrics and auto-stop (see engine/convergence.py)
+CONVERGENCE_EVERY_USERS = 100  # default cadence of convergence messages
+CONVERGENCE_DRAWS = 2000  # Monte Carlo draws per variant for probability-of-best
+CONVERGENCE_MIN_USERS = 200  # auto-stop never fires before this many users
+DEFAULT_CONVERGENCE_THRESHOLD = 0.95  # leader's probability-of-best needed at every step
+
+# Instrumentation (see engine/metrics.py); CONVERGE_METRICS=0 removes it entirely
+METRICS_ENABLED = os.environ.get("CONVERGE_METRICS", "1") != "0"
+
+# Background run execution (see engine/runner.py)
+MAX_CONCURRENT_RUNS = 8
+RUN_RETAIN_SECONDS = 300  # keep a finished run's broadcaster this long for reconnecting clients
+STREAM_RING_SIZE = 10000  # recent messages kept per run for subscribers and Last-Event-ID resume
+
+# Parameter sweeps (see engine/sweep.py)
+SWEEP_MAX_WORKERS = int(os.environ.get("CONVERGE_SWEEP_WORKERS", "0"))  # 0 = one worker per CPU
+SWEEP_MAX_CONFIGS = 256  # largest grid a single sweep request may expand to
+REPLICATE_MAX = 5000  # most Monte Carlo replicates a single request may run
+REPLICATE_CHUNK = 100  # replicates per pool task; fixed so results do not depend on core count
+REPLICATE_BATCH_SIZE = 250  # users per posterior update; also the convergence checkpoint spacing
+
+# SSE stream framing (see engine/stream.py)
+STREAM_TARGET_FPS = 20  # batched formats aim for this many frames per second
+STREAM_MAX_BATCH = 2000  # upper bound on messages packed into one frame
+
+# Event write-behind buffer
+EVENT_FLUSH_SIZE = 5000  # rows per bulk insert
+EVENT_FLUSH_INTERVAL = 0.5  # seconds before a partial buffer is flushed anyway
+EVENT_SINK_MAX_PENDING = 8  # batches queued for the writer before producers block
+
+# Columnar event archive (see engine/archive.py)
+ARCHIVE_FINISHED_RUNS = True  # archive every run when it completes or stops
+ARCHIVE_LIVE_RUNS = os.getenv("CONVERGE_ARCHIVE_LIVE", "") == "1"  # also append while the run is going
+EXPORT_CHUNK_ROWS = 10_000  # rows read, encoded and sent per chunk by /api/data/export
+
+# /api/data/events totals that rollups can't answer (user_number ranges) are counted once and reused
+EVENTS_COUNT_TTL = 5.0  # seconds
+EVENTS_COUNT_CACHE_SIZE = 256  # oldest entries beyond this are dropped
 
 # Persona names for population mix
 PERSONA_NAMES = ["impatient", "skeptical", "casual", "goal_oriented", "anxious"]
@@ -1,12 +1,23 @@
-from sqlalchemy import create_engine
+import hashlib
+
+from sqlalchemy import create_engine, event, inspect
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
-from config import DATABASE_URL
+from config import DATABASE_URL, STORAGE_PROFILES, STORAGE_PROFILE
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine)
 
 
+@event.listens_for(engine, "connect")
+def _apply_storage_profile(dbapi_connection, connection_record):
+    """Set the configured PRAGMAs on each new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    for pragma, value in STORAGE_PROFILES[STORAGE_PROFILE].items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -17,3 +28,63 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def _literal_default(column) -> str:
+    arg = column.default.arg if column.default is not None else None
+    if arg is None or callable(arg):
+        return "NULL"
+    if isinstance(arg, bool):
+        return "1" if arg else "0"
+    if isinstance(arg, (int, float)):
+        return repr(arg)
+    return "'" + str(arg).replace("'", "''") + "'"
+
+
+def schema_fingerprint() -> int:
+    """31-bit hash of the declared tables, columns and indexes, kept in PRAGMA user_version.
+    Any model change changes it, so there is no version number to remember to bump."""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        for column in table.columns:
+            col_type = column.type.compile(dialect=engine.dialect)
+            parts.append(f"{column.name} {col_type} {column.nullable} {_literal_default(column)}")
+        parts.extend(sorted(f"index {index.name}" for index in table.indexes))
+    return int.from_bytes(hashlib.sha256("\n".join(parts).encode()).digest()[:4], "big") & 0x7FFFFFFF
+
+
+def migrate_schema():
+    """Bring an existing database file up to the current models.
+    Creates missing tables, adds missing columns with their scalar default, and creates
+    missing indexes. Columns are never dropped or altered. Skipped entirely when the file's
+    user_version already matches the models' fingerprint."""
+    fingerprint = schema_fingerprint()
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == fingerprint:
+            return
+
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                default = _literal_default(column)
+                not_null = " NOT NULL" if not column.nullable and default != "NULL" else ""
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}{not_null} DEFAULT {default}'
+                )
+                print(f"[database] added column {table.name}.{column.name}")
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+                    print(f"[database] created index {index.name}")
+
+        conn.exec_driver_sql(f"PRAGMA user_version = {fingerprint}")
@@ -0,0 +1,351 @@
+"""
+Hypothesis agent.
+Every agent_trigger_interval users that reach a funnel step, the run snapshots that step's
+bandit aggregates and hands them to a model that explains what is winning and proposes new
+variants. Analyses run as asyncio tasks on the run's own loop, at most AGENT_MAX_CONCURRENT
+at once and one per step, so the simulation never waits on them. Responses are cached by
+prompt hash: an identical prompt reuses the earlier answer instead of calling the model.
+The run loop applies finished analyses itself (apply_agent_result): it writes the Hypothesis,
+Variant and bandit rows and hot-adds the new arms to the in-memory bandit and matrix.
+With CONVERGE_AGENT_MODEL=stub a deterministic local model stands in for Claude.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import (
+    ANTHROPIC_API_KEY,
+    AGENT_MODEL,
+    AGENT_TIMEOUT,
+    AGENT_MAX_CONCURRENT,
+    AGENT_CACHE_SIZE,
+    AGENT_MAX_NEW_VARIANTS,
+    AGENT_MAX_ACTIVE_VARIANTS,
+    AGENT_MIN_EXPOSURES,
+)
+from models.variant import Variant
+from models.bandit_state import BanditState
+from models.run_bandit_state import RunBanditState
+from models.hypothesis import Hypothesis
+from engine.bandit import BanditStore
+from engine.conversion import FEATURE_DIMS, ConversionMatrix
+from engine.metrics import count, timed
+
+_cache: "OrderedDict[str, str]" = OrderedDict()  # prompt hash -> raw model response, shared by all runs
+_cache_lock = threading.Lock()
+
+
+def agent_available() -> bool:
+    return AGENT_MODEL == "stub" or bool(ANTHROPIC_API_KEY)
+
+
+def _round_sig(n: int, digits: int = 2) -> int:
+    """Round a count to a few significant figures so near-identical snapshots share a prompt."""
+    if n <= 0:
+        return 0
+    return int(round(n, digits - len(str(n))))
+
+
+def build_agent_prompt(snapshot: dict, personas) -> str:
+    persona_block = "".join(f"\n- **{p.name}**: {p.description}" for p in personas)
+    variant_block = ""
+    for v in snapshot["variants"]:
+        c = v["content"]
+        features = ", ".join(f"{d}={v['features'].get(d, 0.0):.2f}" for d in FEATURE_DIMS)
+        variant_block += (
+            f"\n- **V{v['variant_id']}**: headline=\"{c.get('headline', '')}\", "
+            f"subtext=\"{c.get('subtext', '')}\", cta=\"{c.get('cta', '')}\"; "
+            f"features: {features}; ~{_round_sig(v['exposures'])} exposures, "
+            f"conversion rate {v['rate']:.2f}"
+        )
+    return f"""You are the optimization analyst for an onboarding funnel A/B test run by a Thompson-sampling bandit.
+
+Funnel step: **{snapshot['step_name']}** (step {snapshot['step_number']} of the funnel).
+
+**Personas in the traffic:**{persona_block}
+
+**Current variants for this step, with observed results:**{variant_block}
+
+Explain why the leading variant is winning, state one testable hypothesis, and propose up to {AGENT_MAX_NEW_VARIANTS} new variants that test it.
+Feature scores are 0.0-1.0 on: {", ".join(FEATURE_DIMS)}.
+
+Return ONLY a JSON object with this exact structure — no other text:
+{{
+  "analysis": "<2-3 sentences>",
+  "hypothesis": "<one sentence>",
+  "confidence": <float 0.0-1.0>,
+  "variants": [
+    {{"content": {{"headline": "...", "subtext": "...", "cta": "..."}}, "features": {{"urgency": <float>, "detail": <float>, "social_proof": <float>, "simplicity": <float>, "reassurance": <float>}}}}
+  ]
+}}"""
+
+
+def _parse_agent_response(text: str) -> dict:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1]
+        text = text.rsplit("```", 1)[0]
+    data = json.loads(text)
+    variants = []
+    for v in data.get("variants", [])[:AGENT_MAX_NEW_VARIANTS]:
+        content = {k: str(v.get("content", {}).get(k, "")) for k in ("headline", "subtext", "cta")}
+        features = {d: float(np.clip(float(v.get("features", {}).get(d, 0.0)), 0.0, 1.0)) for d in FEATURE_DIMS}
+        variants.append({"content": content, "features": features})
+    return {
+        "analysis": str(data["analysis"]),
+        "hypothesis": str(data["hypothesis"]),
+        "confidence": float(np.clip(float(data.get("confidence", 0.5)), 0.0, 1.0)),
+        "variants": variants,
+    }
+
+
+def _stub_response(snapshot: dict) -> str:
+    """Deterministic offline model: lift the leader's weakest feature and propose that variant."""
+    ranked = sorted(snapshot["variants"], key=lambda v: v["alpha"] / (v["alpha"] + v["beta"]), reverse=True)
+    leader = ranked[0]
+    runner_up = ranked[1] if len(ranked) > 1 else leader
+    weakest = min(FEATURE_DIMS, key=lambda d: leader["features"].get(d, 0.0))
+    features = dict(leader["features"])
+    features[weakest] = round(min(1.0, features.get(weakest, 0.0) + 0.3), 2)
+    gap = leader["rate"] - runner_up["rate"]
+    return json.dumps({
+        "analysis": f"V{leader['variant_id']} leads {snapshot['step_name']} at {leader['rate']:.1%} "
+                    f"over {leader['exposures']} exposures, {gap:+.1%} ahead of the runner-up.",
+        "hypothesis": f"Adding {weakest.replace('_', ' ')} to the leading variant will lift conversion.",
+        "confidence": round(min(0.95, 0.5 + abs(gap) * 5), 2),
+        "variants": [{
+            "content": {**leader["content"], "headline": f"{leader['content'].get('headline', '')} ({weakest})"},
+            "features": features,
+        }],
+    })
+
+
+@timed("agent_model")
+async def _call_model(prompt: str, snapshot: dict) -> str:
+    if AGENT_MODEL == "stub":
+        return _stub_response(snapshot)
+    import anthropic
+
+    client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+    response = await asyncio.wait_for(
+        client.messages.create(model=AGENT_MODEL, max_tokens=1024, messages=[{"role": "user", "content": prompt}]),
+        timeout=AGENT_TIMEOUT,
+    )
+    return response.content[0].text
+
+
+async def analyze(snapshot: dict, personas) -> Tuple[dict, bool]:
+    """Run (or reuse) one analysis. Returns (parsed result, served from cache)."""
+    prompt = build_agent_prompt(snapshot, personas)
+    key = hashlib.sha256(f"{AGENT_MODEL}\n{prompt}".encode()).hexdigest()
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+    cached = text is not None
+    count("converge_agent_prompts_total", cache="hit" if cached else "miss")
+    if not cached:
+        text = await _call_model(prompt, snapshot)
+        with _cache_lock:
+            _cache[key] = text
+            while len(_cache) > AGENT_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return _parse_agent_response(text), cached
+
+
+class AgentScheduler:
+    """Decides when each step is due for analysis and runs analyses in the background."""
+
+    def __init__(self, steps, personas, variants, store: BanditStore, every_users: int,
+                 max_concurrent: int = AGENT_MAX_CONCURRENT):
+        self.steps = steps
+        self.personas = personas
+        self.every_users = every_users
+        self.enabled = every_users > 0 and agent_available()
+        self.variants: Dict[int, Variant] = {v.id: v for v in variants}
+        self.added: List[Variant] = []  # hot-added during this run
+        # offset from the store's exposures at start: zero for a run-scoped store (a global
+        # prior seeds alpha/beta, not counts), the running totals for the shared store
+        self._next = {s.id: self._reached(store, s.id) + every_users for s in steps}
+        self._tasks: Dict[int, asyncio.Task] = {}  # step_id -> in-flight analysis
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def trigger(self, store: BanditStore, user_number: int) -> None:
+        """Start analyses for steps that crossed their next threshold. Never blocks."""
+        if not self.enabled:
+            return
+        for step in self.steps:
+            a = store.arms.get(step.id)
+            if a is None:
+                continue
+            reached = self._reached(store, step.id)
+            if reached < self._next[step.id]:
+                continue
+            self._next[step.id] = (reached // self.every_users + 1) * self.every_users
+            if step.id in self._tasks or int(a.active.sum()) >= AGENT_MAX_ACTIVE_VARIANTS:
+                continue
+            snapshot = self._snapshot(step, a, user_number)
+            self._tasks[step.id] = asyncio.create_task(self._run(snapshot))
+
+    @staticmethod
+    def _reached(store: BanditStore, step_id: int) -> int:
+        a = store.arms.get(step_id)
+        return int(a.exposures.sum()) if a is not None else 0
+
+    def completed(self) -> List[dict]:
+        """Finished analyses since the last call; failures are logged and dropped."""
+        results = []
+        for step_id, task in list(self._tasks.items()):
+            if not task.done():
+                continue
+            del self._tasks[step_id]
+            if task.cancelled():
+                continue
+            if task.exception() is not None:
+                print(f"[agent] analysis for step {step_id} failed: {task.exception()}")
+                count("converge_agent_prompts_total", cache="error")
+                continue
+            results.append(task.result())
+        return results
+
+    def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def _run(self, snapshot: dict) -> dict:
+        async with self._semaphore:
+            result, cached = await analyze(snapshot, self.personas)
+        return {**result, "snapshot": snapshot, "cached": cached}
+
+    def _snapshot(self, step, a, user_number: int) -> dict:
+        variants = []
+        for pos in np.flatnonzero(a.active):
+            vid = int(a.variant_ids[pos])
+            v = self.variants.get(vid)
+            exposures, conversions = int(a.exposures[pos]), int(a.conversions[pos])
+            variants.append({
+                "variant_id": vid,
+                "content": v.content if v else {},
+                "features": v.features if v else {},
+                "exposures": exposures,
+                "conversions": conversions,
+                "rate": conversions / exposures if exposures else 0.0,
+                "alpha": float(a.alpha[pos]),
+                "beta": float(a.beta[pos]),
+            })
+        return {"step_id": step.id, "step_number": step.step_number, "step_name": step.name,
+                "user_number": user_number, "variants": variants}
+
+    def extend_matrix(self, matrix: ConversionMatrix, step_variants: Dict[int, List[int]], variants: List[Variant]) -> ConversionMatrix:
+        """Append columns for new variants, calibrated against their step's existing variants.
+        Each persona's probability is the step's mean matrix probability scaled by how the new
+        variant's feature score compares with the existing variants' feature scores, so new arms
+        land on the same scale whether the matrix came from Claude or from the features."""
+        features = ConversionMatrix.from_features(self.personas, list(self.variants.values()) + variants)
+        names = [p.name for p in self.personas]
+        rows = features.persona_indices(names)
+        new_ids = [v.id for v in variants]
+        probs = np.empty((len(names), len(new_ids)))
+        for j, v in enumerate(variants):
+            existing = [vid for vid in step_variants.get(v.step_id, []) if vid not in new_ids]
+            feat_new = features.lookup(rows, features.variant_indices([v.id])[0])
+            if existing:
+                base = matrix.lookup(matrix.persona_indices(names)[:, None], matrix.variant_indices(existing)[None, :]).mean(axis=1)
+                feat_base = features.lookup(rows[:, None], features.variant_indices(existing)[None, :]).mean(axis=1)
+                probs[:, j] = np.where(feat_base > 0, base * feat_new / np.maximum(feat_base, 1e-9), feat_new)
+            else:
+                probs[:, j] = feat_new
+        column_source = ConversionMatrix(names, new_ids, np.clip(probs, 0.01, 0.99))
+        return matrix.extend(column_source, new_ids)
+
+    def carry_over(self, matrix: ConversionMatrix, store: BanditStore) -> ConversionMatrix:
+        """Re-add this run's hot-added variants to a matrix swapped in mid-run."""
+        if not self.added:
+            return matrix
+        step_variants = {sid: a.variant_ids.tolist() for sid, a in store.arms.items()}
+        return self.extend_matrix(matrix, step_variants, self.added)
+
+
+def apply_agent_result(
+    db: Session, run_id: int, result: dict, agent: AgentScheduler, store: BanditStore, matrix: ConversionMatrix
+) -> Tuple[ConversionMatrix, dict]:
+    """Persist one analysis and hot-add its variants. Returns (matrix, hypothesis message)."""
+    snapshot = result["snapshot"]
+    step_id = snapshot["step_id"]
+    generation = max((v.generation for v in agent.variants.values() if v.step_id == step_id), default=0) + 1
+
+    # A run-scoped run keeps its variants out of the global pool: they are created inactive,
+    # with only run bandit rows, and promote_run_state activates them. The run itself samples
+    # them from its in-memory arms either way.
+    scoped = store.model is RunBanditState
+    new_variants = [
+        Variant(step_id=step_id, generation=generation, content=v["content"], features=v["features"],
+                is_active=not scoped)
+        for v in result["variants"]
+    ]
+    db.add_all(new_variants)
+    db.flush()
+    if scoped:
+        states = [RunBanditState(run_id=run_id, variant_id=v.id) for v in new_variants]
+    else:
+        states = [BanditState(variant_id=v.id) for v in new_variants]
+    db.add_all(states)
+    hypothesis = Hypothesis(
+        run_id=run_id,
+        step_id=step_id,
+        trigger_user_count=snapshot["user_number"],
+        analysis=result["analysis"],
+        hypothesis_text=result["hypothesis"],
+        confidence=result["confidence"],
+        generated_variant_ids=[v.id for v in new_variants],
+    )
+    db.add(hypothesis)
+    db.commit()
+
+    if new_variants:
+        store.add_variants(step_id, [v.id for v in new_variants], [s.id for s in states])
+        step_variants = {sid: a.variant_ids.tolist() for sid, a in store.arms.items()}
+        matrix = agent.extend_matrix(matrix, step_variants, new_variants)
+        for v in new_variants:
+            agent.variants[v.id] = v
+        agent.added.extend(new_variants)
+    print(f"[agent] step {snapshot['step_number']}: {result['hypothesis']} (+{len(new_variants)} variants)")
+
+    return matrix, {
+        "type": "hypothesis",
+        "hypothesis_id": hypothesis.id,
+        "step": snapshot["step_number"],
+        "step_id": step_id,
+        "trigger_user_count": snapshot["user_number"],
+        "analysis": result["analysis"],
+        "hypothesis": result["hypothesis"],
+        "confidence": result["confidence"],
+        "cached": result["cached"],
+        "variants": [
+            {"variant_id": v.id, "generation": v.generation, "content": v.content, "features": v.features}
+            for v in new_variants
+        ],
+    }
+
+
+def score_hypotheses(db: Session, run_id: int, store: BanditStore) -> None:
+    """At run end, mark each hypothesis by how its variants fared against the rest of their step."""
+    for h in db.query(Hypothesis).filter(Hypothesis.run_id == run_id, Hypothesis.outcome.is_(None)):
+        a = store.arms.get(h.step_id)
+        if a is None or not h.generated_variant_ids:
+            h.outcome = "no_variants"
+            continue
+        mean = a.alpha / (a.alpha + a.beta)
+        generated = np.isin(a.variant_ids, h.generated_variant_ids)
+        if a.exposures[generated].sum() < AGENT_MIN_EXPOSURES or not (~generated).any():
+            h.outcome = "inconclusive"
+        else:
+            h.outcome = "supported" if mean[generated].max() > mean[~generated].max() else "rejected"
+    db.commit()
@@ -0,0 +1,205 @@
+"""
+Columnar per-run event archive.
+Each run gets a directory under ARCHIVE_DIR holding one raw fixed-width file per field
+plus a meta.json with the row count. Reads memory-map the files, so pages and aggregates
+are served by slicing arrays instead of walking ORM rows.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+from config import ARCHIVE_DIR
+from database import engine
+from models.event import Event
+
+ARCHIVE_FIELDS = {
+    "id": np.int64,
+    "user_number": np.int32,
+    "persona_id": np.int32,
+    "step_id": np.int32,
+    "variant_id": np.int32,
+    "converted": np.bool_,
+    "match_score": np.float64,
+}
+
+SYNC_CHUNK = 100_000
+SCAN_CHUNK = 65_536  # rows per step when a filtered page or count walks the archive
+
+
+def _field_dtypes() -> Dict[str, str]:
+    return {f: np.dtype(d).str for f, d in ARCHIVE_FIELDS.items()}
+
+
+def archive_path(run_id: int) -> Path:
+    return ARCHIVE_DIR / f"run_{run_id}"
+
+
+class ArchiveWriter:
+    """Appends a run's events to its archive. Safe to re-open: picks up after the last archived id."""
+
+    def __init__(self, run_id: int):
+        self.run_id = run_id
+        self.path = archive_path(run_id)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta = _read_meta(self.path)
+        if meta and meta.get("fields") != _field_dtypes():
+            print(f"[archive] run {run_id} archive has an older layout, rebuilding it")
+            meta = None
+        self.rows = meta["rows"] if meta else 0
+        self.last_id = meta["last_id"] if meta else 0
+        if not meta:
+            for field in ARCHIVE_FIELDS:
+                (self.path / f"{field}.bin").write_bytes(b"")
+            self._write_meta(complete=False)
+
+    def append(self, columns: Dict[str, np.ndarray]) -> None:
+        n = len(columns["id"])
+        if n == 0:
+            return
+        for field, dtype in ARCHIVE_FIELDS.items():
+            with open(self.path / f"{field}.bin", "ab") as f:
+                f.write(np.ascontiguousarray(columns[field], dtype=dtype).tobytes())
+        self.rows += n
+        self.last_id = int(columns["id"][-1])
+        self._write_meta(complete=False)
+
+    def sync(self, conn: Connection) -> int:
+        """Copy events written since the last sync from the DB. Returns rows appended."""
+        fields = list(ARCHIVE_FIELDS)
+        appended = 0
+        while True:
+            rows = conn.execute(
+                select(*(getattr(Event, f) for f in fields))
+                .where(Event.run_id == self.run_id, Event.id > self.last_id)
+                .order_by(Event.id)
+                .limit(SYNC_CHUNK)
+            ).all()
+            if not rows:
+                return appended
+            values = list(zip(*rows))
+            self.append({f: np.array(values[i], dtype=ARCHIVE_FIELDS[f]) for i, f in enumerate(fields)})
+            appended += len(rows)
+
+    def finalize(self) -> None:
+        self._write_meta(complete=True)
+
+    def _write_meta(self, complete: bool) -> None:
+        meta = {
+            "run_id": self.run_id,
+            "rows": self.rows,
+            "last_id": self.last_id,
+            "complete": complete,
+            "fields": _field_dtypes(),
+        }
+        tmp = self.path / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.path / "meta.json")  # readers only ever see a consistent row count
+
+
+class EventArchive:
+    """Read-only, memory-mapped view of an archived run."""
+
+    def __init__(self, run_id: int, meta: dict):
+        self.run_id = run_id
+        self.rows = meta["rows"]
+        self.complete = meta["complete"]
+        path = archive_path(run_id)
+        self.columns: Dict[str, np.ndarray] = {}
+        dtypes = meta.get("fields", _field_dtypes())  # archives written before a layout change keep theirs
+        for field in ARCHIVE_FIELDS:
+            dtype = np.dtype(dtypes[field])
+            if self.rows:
+                self.columns[field] = np.memmap(path / f"{field}.bin", dtype=dtype, mode="r", shape=(self.rows,))
+            else:
+                self.columns[field] = np.empty(0, dtype=dtype)
+
+    def page_before(self, before_id: Optional[int], limit: int, filters: Optional[dict] = None,
+                    skip: int = 0) -> Dict[str, np.ndarray]:
+        """Newest-first page of rows with id < before_id (from the newest row when None) that
+        match filters, like ORDER BY id DESC after a keyset cursor. Ids are stored ascending, so
+        the cursor is a binary search; unfiltered pages are one slice, filtered pages scan
+        backwards a chunk at a time until enough rows match."""
+        stop = self.rows if before_id is None else int(np.searchsorted(self.columns["id"], before_id))
+        if not filters:
+            stop = max(stop - skip, 0)
+            start = max(stop - limit, 0)
+            return {f: col[start:stop][::-1] for f, col in self.columns.items()}
+        wanted = skip + limit
+        picked = []
+        found = 0
+        while stop > 0 and found < wanted:
+            start = max(stop - SCAN_CHUNK, 0)
+            idx = (np.flatnonzero(self._mask(start, stop, filters)) + start)[::-1][:wanted - found]
+            picked.append(idx)
+            found += len(idx)
+            stop = start
+        idx = np.concatenate(picked)[skip:] if picked else np.empty(0, dtype=np.int64)
+        return {f: col[idx] for f, col in self.columns.items()}
+
+    def count(self, filters: Optional[dict] = None) -> int:
+        """Rows matching filters, counted a chunk at a time."""
+        if not filters:
+            return self.rows
+        return sum(int(self._mask(start, min(start + SCAN_CHUNK, self.rows), filters).sum())
+                   for start in range(0, self.rows, SCAN_CHUNK))
+
+    def _mask(self, start: int, stop: int, filters: dict) -> np.ndarray:
+        """Boolean mask over rows [start, stop) for equality filters plus user_min/user_max."""
+        mask = np.ones(stop - start, dtype=bool)
+        for field, value in filters.items():
+            if field == "user_min":
+                mask &= self.columns["user_number"][start:stop] >= value
+            elif field == "user_max":
+                mask &= self.columns["user_number"][start:stop] <= value
+            else:
+                mask &= self.columns[field][start:stop] == value
+        return mask
+
+    def aggregate(self, by_persona: bool = False) -> List[dict]:
+        """Exposures and conversions per step x variant (x persona)."""
+        keys = [self.columns["step_id"], self.columns["variant_id"]]
+        if by_persona:
+            keys.append(self.columns["persona_id"])
+        if not self.rows:
+            return []
+        stacked = np.stack([np.asarray(k, dtype=np.int64) for k in keys], axis=1)
+        groups, inverse = np.unique(stacked, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        exposures = np.bincount(inverse, minlength=len(groups))
+        conversions = np.bincount(inverse, weights=self.columns["converted"], minlength=len(groups))
+        result = []
+        for g, exp, conv in zip(groups.tolist(), exposures.tolist(), conversions.tolist()):
+            entry = {"step_id": g[0], "variant_id": g[1], "exposures": exp, "conversions": int(conv),
+                     "rate": round(conv / exp, 4) if exp else 0.0}
+            if by_persona:
+                entry["persona_id"] = g[2]
+            result.append(entry)
+        return result
+
+
+def _read_meta(path: Path) -> Optional[dict]:
+    meta_file = path / "meta.json"
+    if not meta_file.exists():
+        return None
+    return json.loads(meta_file.read_text())
+
+
+def open_archive(run_id: int) -> Optional[EventArchive]:
+    meta = _read_meta(archive_path(run_id))
+    if meta is None:
+        return None
+    return EventArchive(run_id, meta)
+
+
+def archive_run(run_id: int) -> int:
+    """Archive (or finish archiving) a run's events. Returns the total archived rows."""
+    writer = ArchiveWriter(run_id)
+    with engine.connect() as conn:
+        writer.sync(conn)
+    writer.finalize()
+    return writer.rows
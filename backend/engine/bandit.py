@@ -1,41 +1,264 @@
+from typing import Dict, List, Optional, Tuple
+
 import numpy as np
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from models.bandit_state import BanditState
+from models.hypothesis import Hypothesis
+from models.run_bandit_state import RunBanditState
+from models.variant import Variant
+from engine.rng import RunRNG, fallback_rng
+from engine.metrics import timed
 
 
-def thompson_select(db: Session, step_id: int) -> int:
-    """Select a variant for the given step using Thompson Sampling.
-    Returns the variant_id with the highest sampled value."""
-    from models.variant import Variant
+class StepArms:
+    """Beta posteriors for every variant of one funnel step, as parallel arrays."""
+
+    def __init__(self, step_id: int, variant_ids: List[int], state_ids: List[int], active: List[bool],
+                 alpha: List[float], beta: List[float], exposures: List[int], conversions: List[int]):
+        self.step_id = step_id
+        self.variant_ids = np.array(variant_ids, dtype=np.int64)
+        self.state_ids = np.array(state_ids, dtype=np.int64)
+        self.active = np.array(active, dtype=bool)
+        self.alpha = np.array(alpha, dtype=np.float64)
+        self.beta = np.array(beta, dtype=np.float64)
+        self.exposures = np.array(exposures, dtype=np.int64)
+        self.conversions = np.array(conversions, dtype=np.int64)
+        self.dirty = np.zeros(len(variant_ids), dtype=bool)  # changed since the last snapshot
+
+
+class BanditStore:
+    """Per-run bandit state held in memory. Indexed by step, then variant position.
+    The DB is only touched by load and checkpoint; state_ids are primary keys in `model`'s
+    table (run_bandit_states for a run, bandit_states for the global posteriors)."""
+
+    def __init__(self, arms: Dict[int, StepArms], model=BanditState, rng: Optional[RunRNG] = None):
+        self.arms = arms
+        self.model = model
+        self.rng = rng or fallback_rng()
+        # variant_id -> (step_id, position within that step's arrays)
+        self.index: Dict[int, Tuple[int, int]] = {}
+        for step_id, a in arms.items():
+            for pos, vid in enumerate(a.variant_ids.tolist()):
+                self.index[vid] = (step_id, pos)
+
+    @classmethod
+    def fresh(cls, variants_by_step: Dict[int, List[int]], rng: Optional[RunRNG] = None) -> "BanditStore":
+        """Uniform Beta(1, 1) priors for the given variants, with no DB rows behind them."""
+        arms = {}
+        for step_id, variant_ids in variants_by_step.items():
+            k = len(variant_ids)
+            arms[step_id] = StepArms(step_id, variant_ids, [0] * k, [True] * k,
+                                     [1.0] * k, [1.0] * k, [0] * k, [0] * k)
+        return cls(arms, model=None, rng=rng)
+
+    def add_variants(self, step_id: int, variant_ids: List[int], state_ids: List[int]) -> None:
+        """Hot-add new arms with uniform priors; they join the next draw for their step."""
+        a = self.arms.get(step_id)
+        if a is None:
+            a = self.arms[step_id] = StepArms(step_id, [], [], [], [], [], [], [])
+        k = len(variant_ids)
+        start = len(a.variant_ids)
+        a.variant_ids = np.append(a.variant_ids, np.array(variant_ids, dtype=np.int64))
+        a.state_ids = np.append(a.state_ids, np.array(state_ids, dtype=np.int64))
+        a.active = np.append(a.active, np.ones(k, dtype=bool))
+        a.alpha = np.append(a.alpha, np.ones(k))
+        a.beta = np.append(a.beta, np.ones(k))
+        a.exposures = np.append(a.exposures, np.zeros(k, dtype=np.int64))
+        a.conversions = np.append(a.conversions, np.zeros(k, dtype=np.int64))
+        a.dirty = np.append(a.dirty, np.ones(k, dtype=bool))
+        for pos, vid in enumerate(variant_ids, start):
+            self.index[int(vid)] = (step_id, pos)
+
+    @timed("thompson_select")
+    def select(self, step_id: int) -> Optional[int]:
+        """One vectorized Beta draw across the step's variants; returns the argmax variant_id."""
+        a = self.arms.get(step_id)
+        if a is None or not a.active.any():
+            return None
+        samples = self.rng.beta(a.alpha, a.beta)
+        samples[~a.active] = -1.0
+        return int(a.variant_ids[int(np.argmax(samples))])
+
+    @timed("thompson_select_batch")
+    def select_batch(self, step_id: int, n: int) -> Optional[np.ndarray]:
+        """Thompson draws for n users at once as an (n, k) matrix.
+        Returns the chosen variant positions within the step, or None if nothing is active."""
+        a = self.arms.get(step_id)
+        if a is None or not a.active.any():
+            return None
+        samples = self.rng.beta(a.alpha, a.beta, size=(n, len(a.alpha)))
+        samples[:, ~a.active] = -1.0
+        return np.argmax(samples, axis=1)
+
+    @timed("bandit_update")
+    def update(self, variant_id: int, converted: bool) -> None:
+        step_id, pos = self.index[variant_id]
+        a = self.arms[step_id]
+        a.exposures[pos] += 1
+        a.dirty[pos] = True
+        if converted:
+            a.alpha[pos] += 1
+            a.conversions[pos] += 1
+        else:
+            a.beta[pos] += 1
+
+    @timed("bandit_update_batch")
+    def update_batch(self, step_id: int, positions: np.ndarray, converted: np.ndarray) -> None:
+        """Apply a whole batch of observations for one step in aggregate."""
+        a = self.arms[step_id]
+        k = len(a.variant_ids)
+        exposures = np.bincount(positions, minlength=k)
+        conversions = np.bincount(positions[converted], minlength=k)
+        a.exposures += exposures
+        a.conversions += conversions
+        a.alpha += conversions
+        a.beta += exposures - conversions
+        a.dirty |= exposures > 0
 
-    active_variants = (
-        db.query(Variant).filter(Variant.step_id == step_id, Variant.is_active == True).all()
+    def snapshot(self, changed_only: bool = False) -> List[dict]:
+        """Serializable view of the variants' posteriors, in bandit_snapshot shape.
+        With changed_only, only variants updated since the last clear_dirty()."""
+        states = []
+        for a in self.arms.values():
+            positions = np.flatnonzero(a.dirty) if changed_only else range(len(a.variant_ids))
+            for pos in positions:
+                exposures = int(a.exposures[pos])
+                conversions = int(a.conversions[pos])
+                states.append({
+                    "variant_id": int(a.variant_ids[pos]),
+                    "alpha": float(a.alpha[pos]),
+                    "beta": float(a.beta[pos]),
+                    "exposures": exposures,
+                    "conversions": conversions,
+                    "rate": round(conversions / exposures, 4) if exposures > 0 else 0.0,
+                })
+        return states
+
+    def clear_dirty(self) -> None:
+        for a in self.arms.values():
+            a.dirty[:] = False
+
+    @timed("bandit_checkpoint")
+    def checkpoint(self, db: Session) -> None:
+        """Write the in-memory arrays back to the store's table in one bulk UPDATE."""
+        if self.model is None:
+            return
+        rows = []
+        for a in self.arms.values():
+            for pos in range(len(a.variant_ids)):
+                exposures = int(a.exposures[pos])
+                conversions = int(a.conversions[pos])
+                rows.append({
+                    "id": int(a.state_ids[pos]),
+                    "alpha": float(a.alpha[pos]),
+                    "beta_param": float(a.beta[pos]),
+                    "exposures": exposures,
+                    "conversions": conversions,
+                    "rate": conversions / exposures if exposures > 0 else 0.0,
+                })
+        if rows:
+            db.execute(update(self.model), rows)
+        db.commit()
+
+
+def load_bandit_store(
+    db: Session, run_id: Optional[int] = None, prior: str = "global", rng: Optional[RunRNG] = None
+) -> BanditStore:
+    """Read bandit states once and build the in-memory store.
+    With run_id the store is scoped to that run's rows in run_bandit_states, so concurrent
+    runs never share posteriors; the rows are created on first load, starting from the global
+    posteriors (prior="global") or from uniform Beta(1, 1) (prior="fresh")."""
+    if run_id is None:
+        rows = (
+            db.query(Variant.step_id, Variant.id, Variant.is_active, BanditState)
+            .join(BanditState, BanditState.variant_id == Variant.id)
+            .order_by(Variant.step_id, Variant.id)
+            .all()
+        )
+        return _build_store(rows, BanditState, rng)
+
+    if db.query(RunBanditState.id).filter(RunBanditState.run_id == run_id).first() is None:
+        _init_run_states(db, run_id, prior)
+    rows = (
+        db.query(Variant.step_id, Variant.id, Variant.is_active, RunBanditState)
+        .join(RunBanditState, (RunBanditState.variant_id == Variant.id) & (RunBanditState.run_id == run_id))
+        .order_by(Variant.step_id, Variant.id)
+        .all()
     )
-    variant_ids = [v.id for v in active_variants]
+    return _build_store(rows, RunBanditState, rng)
+
 
-    states = db.query(BanditState).filter(BanditState.variant_id.in_(variant_ids)).all()
+def _init_run_states(db: Session, run_id: int, prior: str) -> None:
+    """Create a run's bandit rows. Counts start at zero; only the posterior is inherited."""
+    rows = db.query(Variant.id, BanditState).outerjoin(BanditState, BanditState.variant_id == Variant.id).all()
+    db.add_all(
+        RunBanditState(
+            run_id=run_id,
+            variant_id=variant_id,
+            alpha=bs.alpha if bs is not None and prior == "global" else 1.0,
+            beta_param=bs.beta_param if bs is not None and prior == "global" else 1.0,
+        )
+        for variant_id, bs in rows
+    )
+    db.commit()
 
-    best_variant_id = None
-    best_sample = -1.0
 
-    for state in states:
-        sample = np.random.beta(state.alpha, state.beta_param)
-        if sample > best_sample:
-            best_sample = sample
-            best_variant_id = state.variant_id
+def _build_store(rows, model, rng: Optional[RunRNG]) -> BanditStore:
+    grouped: Dict[int, list] = {}
+    for step_id, variant_id, is_active, bs in rows:
+        grouped.setdefault(step_id, []).append((variant_id, bs.id, is_active, bs))
 
-    return best_variant_id
+    arms = {}
+    for step_id, items in grouped.items():
+        arms[step_id] = StepArms(
+            step_id,
+            variant_ids=[i[0] for i in items],
+            state_ids=[i[1] for i in items],
+            active=[i[2] for i in items],
+            alpha=[i[3].alpha for i in items],
+            beta=[i[3].beta_param for i in items],
+            exposures=[i[3].exposures for i in items],
+            conversions=[i[3].conversions for i in items],
+        )
+    return BanditStore(arms, model, rng)
+
+
+def promote_run_state(db: Session, run_id: int) -> int:
+    """Fold a run's observations into the global posteriors. Returns variants updated.
+    Adds the run's counts rather than copying its posterior, so promoting several runs
+    that started from the same prior does not double count or lose either one.
+    Variants the agent generated during the run join the global pool here."""
+    run_rows = db.query(RunBanditState).filter(RunBanditState.run_id == run_id, RunBanditState.exposures > 0).all()
+    global_rows = {bs.variant_id: bs for bs in db.query(BanditState).all()}
+    generated = [vid for (ids,) in db.query(Hypothesis.generated_variant_ids).filter(Hypothesis.run_id == run_id)
+                 for vid in ids]
+    if generated:
+        db.execute(update(Variant).where(Variant.id.in_(generated)).values(is_active=True))
+        for vid in generated:
+            if vid not in global_rows:
+                global_rows[vid] = BanditState(variant_id=vid, alpha=1.0, beta_param=1.0, exposures=0, conversions=0)
+                db.add(global_rows[vid])
+    for r in run_rows:
+        bs = global_rows.get(r.variant_id)
+        if bs is None:
+            bs = BanditState(variant_id=r.variant_id, alpha=1.0, beta_param=1.0, exposures=0, conversions=0)
+            db.add(bs)
+        bs.alpha += r.conversions
+        bs.beta_param += r.exposures - r.conversions
+        bs.exposures += r.exposures
+        bs.conversions += r.conversions
+        bs.rate = bs.conversions / bs.exposures if bs.exposures > 0 else 0.0
+    return len(run_rows)
+
+
+def thompson_select(store: BanditStore, step_id: int) -> Optional[int]:
+    """Select a variant for the given step using Thompson Sampling.
+    Returns the variant_id with the highest sampled value."""
+    return store.select(step_id)
 
 
-def update_bandit(db: Session, variant_id: int, converted: bool) -> None:
+def update_bandit(store: BanditStore, variant_id: int, converted: bool) -> None:
     """Update the bandit state for a variant after an observation."""
-    state = db.query(BanditState).filter(BanditState.variant_id == variant_id).one()
-    state.exposures += 1
-    if converted:
-        state.alpha += 1
-        state.conversions += 1
-    else:
-        state.beta_param += 1
-    state.rate = state.conversions / state.exposures if state.exposures > 0 else 0.0
-    db.flush()
+    store.update(variant_id, converted)
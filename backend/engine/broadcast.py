@@ -0,0 +1,70 @@
+"""
+Per-run pub/sub for simulation messages.
+The run's worker publishes each message once into a bounded ring buffer, tagged with a
+sequence number that doubles as the SSE id. Any number of subscribers read from the ring
+at their own pace, so they share one producer; a reconnecting client passes its
+Last-Event-ID and resumes right after it. A subscriber that falls further behind than the
+ring holds skips ahead and is told how many messages it missed, so memory stays bounded.
+"""
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncGenerator, List, Optional, Tuple
+
+from config import STREAM_RING_SIZE
+
+Frame = Tuple[Optional[int], dict]  # (sequence id, message); id is None for synthetic messages
+
+
+class RunBroadcaster:
+    def __init__(self, capacity: int = STREAM_RING_SIZE):
+        self._ring: deque = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.closed = False
+        self.subscribers = 0
+        self.dropped = 0  # messages skipped by slow subscribers, summed over all of them
+
+    @property
+    def last_id(self) -> int:
+        return self._seq
+
+    def publish(self, message: dict) -> int:
+        with self._lock:
+            self._seq += 1
+            self._ring.append((self._seq, message))
+            return self._seq
+
+    def close(self) -> None:
+        self.closed = True
+
+    def read_since(self, after: int) -> Tuple[List[Frame], int]:
+        """Frames with id > after, plus how many such frames already fell out of the ring."""
+        with self._lock:
+            if not self._ring:
+                return [], 0
+            oldest = self._ring[0][0]
+            missed = max(0, oldest - after - 1)
+            start = max(0, after + 1 - oldest)
+            return [self._ring[i] for i in range(start, len(self._ring))], missed
+
+    async def subscribe(self, last_event_id: int = 0, poll_interval: float = 0.02) -> AsyncGenerator[Frame, None]:
+        """Yield (id, message) frames after last_event_id until the run ends and the ring is drained."""
+        cursor = last_event_id
+        self.subscribers += 1
+        try:
+            while True:
+                frames, missed = self.read_since(cursor)
+                if missed:
+                    self.dropped += missed
+                    print(f"[broadcast] slow subscriber skipped {missed} messages")
+                    yield None, {"type": "dropped", "count": missed}
+                for frame in frames:
+                    cursor = frame[0]
+                    yield frame
+                if not frames:
+                    if self.closed and cursor >= self._seq:
+                        return
+                    await asyncio.sleep(poll_interval)
+        finally:
+            self.subscribers -= 1
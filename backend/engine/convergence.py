@@ -0,0 +1,127 @@
+"""
+Online convergence metrics for a running simulation.
+Regret is measured against the matrix's oracle: for each step, the active variant with the
+highest expected conversion rate under the population mix. It is accumulated from the
+bandit's exposure counts between polls, so the per-user path pays nothing for it.
+Probability-of-best comes from Monte Carlo Beta draws kept in a per-step pool; only the
+columns of variants whose posterior moved since the last poll are redrawn.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from config import CONVERGENCE_DRAWS, CONVERGENCE_EVERY_USERS, CONVERGENCE_MIN_USERS
+from engine.bandit import BanditStore
+from engine.conversion import ConversionMatrix
+from engine.rng import RunRNG, fallback_rng
+
+
+class DrawPool:
+    """Cached (draws x variants) Beta samples for one step."""
+
+    def __init__(self, k: int, draws: int = CONVERGENCE_DRAWS):
+        self.samples = np.empty((draws, k))
+        self.alpha = np.full(k, np.nan)
+        self.beta = np.full(k, np.nan)
+
+    def refresh(self, alpha: np.ndarray, beta: np.ndarray, rng: RunRNG) -> np.ndarray:
+        stale = np.flatnonzero((alpha != self.alpha) | (beta != self.beta))
+        if len(stale):
+            self.samples[:, stale] = rng.beta(alpha[stale], beta[stale], size=(len(self.samples), len(stale)))
+            self.alpha[stale] = alpha[stale]
+            self.beta[stale] = beta[stale]
+        return self.samples
+
+
+class ConvergenceTracker:
+    def __init__(self, steps, persona_names, every_users: int = CONVERGENCE_EVERY_USERS,
+                 threshold: float = 0.95, min_users: int = CONVERGENCE_MIN_USERS, rng: Optional[RunRNG] = None):
+        self.steps = steps
+        self.rng = rng or fallback_rng()
+        self.persona_names = list(persona_names)
+        self.every_users = every_users
+        self.threshold = threshold
+        self.min_users = min_users
+        self.cumulative_regret = 0.0
+        self._pools: Dict[int, DrawPool] = {}
+        self._last_exposures: Dict[int, np.ndarray] = {}
+        self._last_user = 0
+        self._means: Dict[int, np.ndarray] = {}
+        self._means_key = None
+
+    def _arm_means(self, store: BanditStore, matrix: ConversionMatrix, population_mix: dict) -> Dict[int, np.ndarray]:
+        """Expected rate of every variant under the mix, per step.
+        Recomputed when the matrix, the mix or the set of variants changes."""
+        key = (id(matrix), tuple(len(a.variant_ids) for a in store.arms.values()), tuple(sorted(population_mix.items())))
+        if key != self._means_key:
+            weights = np.array([population_mix.get(n, 0.2) for n in self.persona_names], dtype=np.float64)
+            weights /= weights.sum()
+            rows = matrix.persona_indices(self.persona_names)
+            self._means = {
+                step_id: weights @ matrix.lookup(*np.ix_(rows, matrix.variant_indices(a.variant_ids)))
+                for step_id, a in store.arms.items()
+            }
+            self._means_key = key
+        return self._means
+
+    def poll(self, store: BanditStore, matrix: ConversionMatrix, population_mix: dict, user_number: int,
+             force: bool = False) -> Optional[dict]:
+        """Return the next convergence message if one is due, else None.
+        force emits regardless of cadence (e.g. at run end) unless nothing happened since the last one."""
+        if user_number - self._last_user < (1 if force else self.every_users):
+            return None
+        users = user_number - self._last_user
+        self._last_user = user_number
+        means = self._arm_means(store, matrix, population_mix)
+
+        window_regret = 0.0
+        window_exposures = 0
+        step_metrics = []
+        for step in self.steps:
+            a = store.arms.get(step.id)
+            if a is None or not a.active.any():
+                continue
+            mean = np.where(a.active, means[step.id], -np.inf)
+            oracle = int(np.argmax(mean))
+
+            last = self._last_exposures.get(step.id, np.zeros(0, dtype=np.int64))
+            delta = a.exposures - np.pad(last, (0, len(a.exposures) - len(last)))  # hot-added arms start at 0
+            self._last_exposures[step.id] = a.exposures.copy()
+            window_regret += float(delta @ np.where(a.active, mean[oracle] - mean, 0.0))
+            window_exposures += int(delta.sum())
+
+            pool = self._pools.get(step.id)
+            if pool is None or pool.samples.shape[1] != len(a.alpha):
+                pool = self._pools[step.id] = DrawPool(len(a.alpha))
+            samples = pool.refresh(a.alpha, a.beta, self.rng)
+            masked = np.where(a.active, samples, -np.inf)
+            best = masked.max(axis=1)
+            prob_best = np.bincount(np.argmax(masked, axis=1), minlength=len(a.alpha)) / len(samples)
+            leader = int(np.argmax(prob_best))
+            step_metrics.append({
+                "step": step.step_number,
+                "step_id": step.id,
+                "leader_variant_id": int(a.variant_ids[leader]),
+                "oracle_variant_id": int(a.variant_ids[oracle]),
+                # posterior expected shortfall of committing to the leader now
+                "expected_loss": round(float((best - samples[:, leader]).mean()), 5),
+                "converged": bool(prob_best[leader] >= self.threshold),
+                "variants": [
+                    {"variant_id": int(a.variant_ids[pos]), "prob_best": round(float(prob_best[pos]), 4)}
+                    for pos in np.flatnonzero(a.active)
+                ],
+            })
+
+        self.cumulative_regret += window_regret
+        return {
+            "type": "convergence",
+            "user_number": user_number,
+            "regret": {
+                "cumulative": round(self.cumulative_regret, 3),
+                "instantaneous": round(window_regret / window_exposures, 5) if window_exposures else 0.0,
+                "per_user": round(window_regret / users, 5) if users > 0 else 0.0,
+            },
+            "converged": bool(step_metrics) and user_number >= self.min_users and all(s["converged"] for s in step_metrics),
+            "threshold": self.threshold,
+            "steps": step_metrics,
+        }
@@ -1,7 +1,9 @@
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 
+from engine.rng import RunRNG, fallback_rng
+
 # Feature dimensions — used as fallback when no Claude matrix is available
 FEATURE_DIMS = ["urgency", "detail", "social_proof", "simplicity", "reassurance"]
 
@@ -14,24 +16,115 @@ def compute_conversion_probability(persona_prefs: dict, variant_features: dict)
     return float(np.clip(raw, 0.0, 1.0))
 
 
+DEFAULT_PROBABILITY = 0.3  # used for any persona-variant pair the matrix does not cover
+
+
+class ConversionMatrix:
+    """Persona × variant conversion probabilities as a dense 2-D array.
+    persona_index and variant_index map names/ids to stable row/column positions.
+    Unknown personas or variants (index -1) read DEFAULT_PROBABILITY."""
+
+    def __init__(self, persona_names: List[str], variant_ids: List[int], probs: np.ndarray):
+        self.persona_index: Dict[str, int] = {name: i for i, name in enumerate(persona_names)}
+        self.variant_index: Dict[int, int] = {int(vid): j for j, vid in enumerate(variant_ids)}
+        # One extra row and column of defaults, so index -1 needs no special casing
+        self._table = np.full((len(persona_names) + 1, len(variant_ids) + 1), DEFAULT_PROBABILITY)
+        self._table[:-1, :-1] = probs
+
+    @property
+    def probs(self) -> np.ndarray:
+        return self._table[:-1, :-1]
+
+    @classmethod
+    def from_pairs(
+        cls,
+        pairs: Dict[Tuple[str, int], float],
+        persona_names: Optional[Iterable[str]] = None,
+        variant_ids: Optional[Iterable[int]] = None,
+    ) -> "ConversionMatrix":
+        """Build from a (persona_name, variant_id) -> probability mapping; gaps get the default."""
+        persona_names = list(persona_names) if persona_names is not None else sorted({k[0] for k in pairs})
+        variant_ids = list(variant_ids) if variant_ids is not None else sorted({k[1] for k in pairs})
+        matrix = cls(persona_names, variant_ids, np.full((len(persona_names), len(variant_ids)), DEFAULT_PROBABILITY))
+        for (persona_name, variant_id), prob in pairs.items():
+            i = matrix.persona_index.get(persona_name)
+            j = matrix.variant_index.get(variant_id)
+            if i is not None and j is not None:
+                matrix._table[i, j] = prob
+        return matrix
+
+    @classmethod
+    def from_features(cls, personas, variants) -> "ConversionMatrix":
+        """Dot-product fallback for every pair at once: (P x D) @ (D x V) / D."""
+        prefs = np.array([[p.preferences.get(d, 0.0) for d in FEATURE_DIMS] for p in personas]).reshape(-1, len(FEATURE_DIMS))
+        feats = np.array([[v.features.get(d, 0.0) for d in FEATURE_DIMS] for v in variants]).reshape(-1, len(FEATURE_DIMS))
+        probs = np.clip(prefs @ feats.T / len(FEATURE_DIMS), 0.0, 1.0)
+        return cls([p.name for p in personas], [v.id for v in variants], probs)
+
+    def extend(self, other: "ConversionMatrix", variant_ids: Iterable[int]) -> "ConversionMatrix":
+        """A new matrix with other's columns for variant_ids appended (e.g. hot-added variants)."""
+        persona_names = list(self.persona_index)
+        variant_ids = [int(v) for v in variant_ids]
+        columns = other.lookup(other.persona_indices(persona_names)[:, None], other.variant_indices(variant_ids)[None, :])
+        return ConversionMatrix(persona_names, list(self.variant_index) + variant_ids, np.hstack([self.probs, columns]))
+
+    def __len__(self) -> int:
+        return self.probs.size
+
+    def get(self, persona_name: str, variant_id: int, default: float = DEFAULT_PROBABILITY) -> float:
+        i = self.persona_index.get(persona_name)
+        j = self.variant_index.get(variant_id)
+        if i is None or j is None:
+            return default
+        return float(self._table[i, j])
+
+    def items(self) -> Iterator[Tuple[Tuple[str, int], float]]:
+        """((persona_name, variant_id), probability) pairs, row-major."""
+        for name, i in self.persona_index.items():
+            for vid, j in self.variant_index.items():
+                yield (name, vid), float(self._table[i, j])
+
+    def persona_indices(self, persona_names: Iterable[str]) -> np.ndarray:
+        return np.array([self.persona_index.get(n, -1) for n in persona_names], dtype=np.int64)
+
+    def variant_indices(self, variant_ids: Iterable[int]) -> np.ndarray:
+        return np.array([self.variant_index.get(int(v), -1) for v in variant_ids], dtype=np.int64)
+
+    def lookup(self, persona_idx: np.ndarray, variant_idx: np.ndarray) -> np.ndarray:
+        """Probabilities for index arrays (broadcast like numpy fancy indexing); -1 reads the default."""
+        return self._table[persona_idx, variant_idx]
+
+    def simulate(
+        self, persona_idx: np.ndarray, variant_idx: np.ndarray, noise: float = 0.08, rng: Optional[RunRNG] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Batched simulate_conversion_with_matrix. Returns (converted[], match_score[])."""
+        rng = rng or fallback_rng()
+        probs = self.lookup(persona_idx, variant_idx)
+        noisy = np.clip(probs + rng.uniform(-noise, noise, size=probs.shape), 0.01, 0.99)
+        return rng.random(probs.shape) < noisy, probs
+
+
 def simulate_conversion_with_matrix(
     persona_name: str,
     variant_id: int,
-    matrix: dict,
+    matrix: ConversionMatrix,
     noise: float = 0.08,
+    rng: Optional[RunRNG] = None,
 ) -> Tuple[bool, float]:
     """Use the Claude-generated probability matrix. Returns (converted, match_score)."""
-    prob = matrix.get((persona_name, variant_id), 0.3)
-    noisy_prob = prob + np.random.uniform(-noise, noise)
-    noisy_prob = float(np.clip(noisy_prob, 0.01, 0.99))
-    converted = bool(np.random.random() < noisy_prob)
+    rng = rng or fallback_rng()
+    prob = matrix.get(persona_name, variant_id)
+    noisy_prob = min(max(prob + rng.uniform(-noise, noise), 0.01), 0.99)
+    converted = rng.random() < noisy_prob
     return converted, prob
 
 
-def simulate_conversion(persona_prefs: dict, variant_features: dict, noise: float = 0.1) -> Tuple[bool, float]:
+def simulate_conversion(
+    persona_prefs: dict, variant_features: dict, noise: float = 0.1, rng: Optional[RunRNG] = None
+) -> Tuple[bool, float]:
     """Dot-product fallback. Returns (converted, match_score)."""
+    rng = rng or fallback_rng()
     prob = compute_conversion_probability(persona_prefs, variant_features)
-    noisy_prob = prob + np.random.uniform(-noise, noise)
-    noisy_prob = float(np.clip(noisy_prob, 0.01, 0.99))
-    converted = bool(np.random.random() < noisy_prob)
+    noisy_prob = min(max(prob + rng.uniform(-noise, noise), 0.01), 0.99)
+    converted = rng.random() < noisy_prob
     return converted, prob
@@ -0,0 +1,166 @@
+"""
+Write-behind sink for the events table.
+Events are buffered as plain tuples (or column arrays from turbo ticks) and handed to a
+background writer thread, which inserts each batch with a single executemany and folds it
+into the run's rollup counters in the same transaction.
+"""
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import EVENT_FLUSH_SIZE, EVENT_FLUSH_INTERVAL, EVENT_SINK_MAX_PENDING, ARCHIVE_LIVE_RUNS
+from database import engine
+from engine.archive import ArchiveWriter
+from engine.metrics import bind_run, count, timed
+from models.event import Event
+from models.run_rollup import RunRollup
+
+EVENT_FIELDS = ("user_number", "persona_id", "step_id", "variant_id", "converted", "match_score")
+
+_STOP = object()
+
+_rollup_insert = sqlite_insert(RunRollup)
+_ROLLUP_UPSERT = _rollup_insert.on_conflict_do_update(
+    index_elements=["run_id", "step_id", "variant_id", "persona_id"],
+    set_={
+        "exposures": RunRollup.exposures + _rollup_insert.excluded.exposures,
+        "conversions": RunRollup.conversions + _rollup_insert.excluded.conversions,
+    },
+)
+
+
+class EventSink:
+    """Buffers events for one run and writes them in bulk off the simulation path.
+    Flushes when the buffer reaches flush_size rows or flush_interval seconds have passed.
+    When max_pending batches are already waiting on the writer, flush() blocks (back-pressure).
+    With live_archive, each written batch is also appended to the run's columnar archive."""
+
+    def __init__(
+        self,
+        run_id: int,
+        flush_size: int = EVENT_FLUSH_SIZE,
+        flush_interval: float = EVENT_FLUSH_INTERVAL,
+        max_pending: int = EVENT_SINK_MAX_PENDING,
+        live_archive: bool = ARCHIVE_LIVE_RUNS,
+    ):
+        self.run_id = run_id
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self._archive = ArchiveWriter(run_id) if live_archive else None
+
+        self._chunks: List = []  # lists of tuples or column dicts
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._pending: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name=f"event-sink-{run_id}", daemon=True)
+        self._writer.start()
+
+    def add(self, user_number: int, persona_id: int, step_id: int, variant_id: int,
+            converted: bool, match_score: float) -> None:
+        if not self._chunks or not isinstance(self._chunks[-1], list):
+            self._chunks.append([])
+        self._chunks[-1].append((user_number, persona_id, step_id, variant_id, converted, match_score))
+        self._buffered += 1
+        self.flush_if_due()
+
+    def add_columns(self, columns: Dict[str, np.ndarray]) -> None:
+        """Buffer a batch of events given as parallel arrays keyed by EVENT_FIELDS."""
+        n = len(columns["user_number"])
+        if n == 0:
+            return
+        self._chunks.append(columns)
+        self._buffered += n
+        self.flush_if_due()
+
+    @property
+    def pending(self) -> int:
+        """Batches handed to the writer and not yet written."""
+        return self._pending.qsize()
+
+    def flush_if_due(self) -> None:
+        if self._buffered >= self.flush_size or (
+            self._buffered and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """Hand the current buffer to the writer thread. Blocks while the writer is saturated."""
+        self._raise_writer_error()
+        self._last_flush = time.monotonic()
+        if not self._buffered:
+            return
+        chunks, self._chunks, self._buffered = self._chunks, [], 0
+        self._pending.put(chunks)
+
+    def close(self) -> None:
+        """Final flush, then wait for the writer to drain. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.flush()
+        finally:
+            self._pending.put(_STOP)
+            self._writer.join()
+        self._raise_writer_error()
+
+    def _raise_writer_error(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"event sink for run {self.run_id} failed") from self._error
+
+    def _write_loop(self) -> None:
+        bind_run(self.run_id)
+        while True:
+            chunks = self._pending.get()
+            if chunks is _STOP:
+                return
+            if self._error is not None:
+                continue  # drain so producers never block on a dead writer
+            try:
+                self._write(chunks)
+            except Exception as e:
+                print(f"[event_sink] run {self.run_id} write failed: {e}")
+                self._error = e
+
+    @timed("db_flush")
+    def _write(self, chunks: list) -> None:
+        rows = self._to_rows(chunks)
+        with engine.begin() as conn:
+            conn.execute(insert(Event), rows)
+            conn.execute(_ROLLUP_UPSERT, self._rollup_rows(rows))
+            if self._archive is not None:
+                self._archive.sync(conn)
+        self.rows_written += len(rows)
+        count("converge_events_written_total", len(rows))
+
+    def _rollup_rows(self, rows: List[dict]) -> List[dict]:
+        counts = defaultdict(lambda: [0, 0])
+        for r in rows:
+            c = counts[(r["step_id"], r["variant_id"], r["persona_id"])]
+            c[0] += 1
+            c[1] += bool(r["converted"])
+        return [
+            {"run_id": self.run_id, "step_id": s, "variant_id": v, "persona_id": p,
+             "exposures": exp, "conversions": conv}
+            for (s, v, p), (exp, conv) in counts.items()
+        ]
+
+    def _to_rows(self, chunks: list) -> List[dict]:
+        rows = []
+        for chunk in chunks:
+            if isinstance(chunk, dict):
+                chunk = zip(*(chunk[f].tolist() for f in EVENT_FIELDS))
+            for values in chunk:
+                row = dict(zip(EVENT_FIELDS, values))
+                row["run_id"] = self.run_id
+                rows.append(row)
+        return rows
@@ -0,0 +1,92 @@
+"""
+Streaming bulk export of a run's event log as NDJSON or CSV, optionally gzip-compressed.
+Rows are read in EXPORT_CHUNK_ROWS chunks, from a server-side cursor (yield_per) on the
+database or by slicing the memory-mapped archive, and each chunk is encoded and yielded
+before the next is read, so memory stays flat whatever the run size.
+"""
+import csv
+import io
+import zlib
+from typing import Dict, Iterator, List
+
+from sqlalchemy import select
+
+from config import EXPORT_CHUNK_ROWS
+from database import engine
+from models.event import Event
+from models.persona import Persona
+from models.funnel_step import FunnelStep
+from engine.archive import EventArchive
+from engine.stream import dumps
+
+EXPORT_FIELDS = ["id", "user_number", "persona_id", "step_id", "variant_id", "converted", "match_score"]
+NAME_FIELDS = ["persona", "step_number", "step_name"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _db_chunks(run_id: int) -> Iterator[List[tuple]]:
+    columns = [getattr(Event, f) for f in EXPORT_FIELDS]
+    stmt = (
+        select(*columns)
+        .where(Event.run_id == run_id)
+        .order_by(Event.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    with engine.connect() as conn:
+        for partition in conn.execute(stmt).partitions():
+            yield partition
+
+
+def _archive_chunks(archive: EventArchive) -> Iterator[List[tuple]]:
+    for start in range(0, archive.rows, EXPORT_CHUNK_ROWS):
+        stop = min(start + EXPORT_CHUNK_ROWS, archive.rows)
+        yield list(zip(*(archive.columns[f][start:stop].tolist() for f in EXPORT_FIELDS)))
+
+
+def _name_lookup() -> Dict[str, dict]:
+    """persona_id -> name and step_id -> (number, name); small tables, read once per export."""
+    with engine.connect() as conn:
+        personas = dict(conn.execute(select(Persona.id, Persona.name)).all())
+        steps = {sid: (num, name) for sid, num, name in conn.execute(
+            select(FunnelStep.id, FunnelStep.step_number, FunnelStep.name))}
+    return {"personas": personas, "steps": steps}
+
+
+def _with_names(rows: List[tuple], names: Dict[str, dict]) -> List[tuple]:
+    personas, steps = names["personas"], names["steps"]
+    return [tuple(row) + (personas.get(row[2]),) + steps.get(row[3], (None, None)) for row in rows]
+
+
+def _encode_ndjson(rows: List[tuple], fields: List[str]) -> str:
+    return "".join(dumps(dict(zip(fields, row))) + "\n" for row in rows)
+
+
+def _encode_csv(rows: List[tuple], fields: List[str]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+def export_events(run_id: int, fmt: str = "ndjson", names: bool = False, compress: bool = False,
+                  archive: EventArchive = None) -> Iterator[bytes]:
+    """Yield the run's events, oldest first, as encoded (and optionally gzipped) byte chunks.
+    Reads from archive when one is given, else from the database."""
+    fields = EXPORT_FIELDS + (NAME_FIELDS if names else [])
+    lookup = _name_lookup() if names else None
+    encode = _encode_ndjson if fmt == "ndjson" else _encode_csv
+    gz = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    def emit(text: str) -> bytes:
+        data = text.encode()
+        return gz.compress(data) if gz else data
+
+    if fmt == "csv":
+        yield emit(",".join(fields) + "\n")
+    for rows in (_archive_chunks(archive) if archive is not None else _db_chunks(run_id)):
+        if lookup:
+            rows = _with_names(rows, lookup)
+        chunk = emit(encode(rows, fields))
+        if chunk:
+            yield chunk
+    if gz:
+        yield gz.flush()
@@ -0,0 +1,104 @@
+"""
+Content-addressed cache for Claude conversion matrices.
+The key hashes everything the scoring prompt depends on (persona descriptions, step names,
+variant content) plus the model name, so an unchanged setup reuses the previous matrix
+instead of calling the API again. Only Claude results are cached; the dot-product
+fallback is cheap and should not shadow a later successful call.
+"""
+import hashlib
+import json
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from config import SCORER_MODEL, MATRIX_CACHE_MAX_ENTRIES, MATRIX_CACHE_TTL_DAYS
+from models.matrix_cache import MatrixCacheEntry
+from engine.conversion import ConversionMatrix
+from engine.scorer import score_with_claude, score_with_features
+from engine.metrics import count
+
+
+def matrix_cache_key(personas, steps, variants, model: str = SCORER_MODEL) -> str:
+    payload = {
+        "model": model,
+        "personas": sorted([p.name, p.description] for p in personas),
+        "steps": sorted([s.id, s.name] for s in steps),
+        "variants": sorted([v.id, v.step_id, v.content] for v in variants),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(db: Session, key: str, touch: bool = True) -> Optional[ConversionMatrix]:
+    """touch=False is a read-only peek: no hit is recorded and nothing is committed."""
+    entry = db.query(MatrixCacheEntry).filter(MatrixCacheEntry.key == key).first()
+    if entry is None:
+        return None
+    if time.time() - entry.created_at > MATRIX_CACHE_TTL_DAYS * 86400:
+        if touch:
+            db.delete(entry)
+            db.commit()
+        return None
+    if touch:
+        entry.hits += 1
+        entry.last_used_at = time.time()
+        db.commit()
+    return ConversionMatrix.from_pairs({(persona, variant_id): prob for persona, variant_id, prob in entry.scores})
+
+
+def store(db: Session, key: str, matrix: ConversionMatrix, model: str = SCORER_MODEL) -> None:
+    now = time.time()
+    entry = db.query(MatrixCacheEntry).filter(MatrixCacheEntry.key == key).first()
+    if entry is None:
+        entry = MatrixCacheEntry(key=key, model=model, created_at=now, hits=0)
+        db.add(entry)
+    entry.scores = [[persona, variant_id, prob] for (persona, variant_id), prob in matrix.items()]
+    entry.created_at = now
+    entry.last_used_at = now
+    db.flush()
+    evict(db)
+    db.commit()
+
+
+def evict(db: Session) -> int:
+    """Drop expired entries, then least recently used ones beyond MATRIX_CACHE_MAX_ENTRIES."""
+    cutoff = time.time() - MATRIX_CACHE_TTL_DAYS * 86400
+    removed = db.query(MatrixCacheEntry).filter(MatrixCacheEntry.created_at < cutoff).delete()
+    stale = (
+        db.query(MatrixCacheEntry.id)
+        .order_by(MatrixCacheEntry.last_used_at.desc())
+        .offset(MATRIX_CACHE_MAX_ENTRIES)
+        .all()
+    )
+    if stale:
+        removed += (
+            db.query(MatrixCacheEntry)
+            .filter(MatrixCacheEntry.id.in_([row.id for row in stale]))
+            .delete(synchronize_session=False)
+        )
+    return removed
+
+
+def cached_matrix(db: Session, personas, steps, variants, touch: bool = True) -> Tuple[Optional[ConversionMatrix], str]:
+    """Cache-only lookup. Returns (matrix or None, cache key). See lookup for touch."""
+    key = matrix_cache_key(personas, steps, variants)
+    matrix = lookup(db, key, touch)
+    if matrix is not None:
+        print(f"[matrix_cache] hit {key[:12]} ({len(matrix)} scores)")
+    count("converge_matrix_cache_lookups_total", result="hit" if matrix is not None else "miss")
+    return matrix, key
+
+
+def get_conversion_matrix(db: Session, personas, steps, variants) -> Tuple[ConversionMatrix, dict]:
+    """Cached replacement for generate_conversion_matrix.
+    Returns (matrix, info) where info reports the cache key, hit/miss and the matrix source."""
+    matrix, key = cached_matrix(db, personas, steps, variants)
+    if matrix is not None:
+        return matrix, {"cache": "hit", "cache_key": key, "source": "claude"}
+
+    matrix = score_with_claude(personas, steps, variants)
+    if matrix is not None:
+        store(db, key, matrix)
+        return matrix, {"cache": "miss", "cache_key": key, "source": "claude"}
+
+    return score_with_features(personas, variants), {"cache": "miss", "cache_key": key, "source": "fallback"}
@@ -0,0 +1,182 @@
+"""
+Hot-path instrumentation, exposed in Prometheus text format at /api/metrics.
+Stage timings are process-wide histograms labelled by stage. Timings taken while a run is
+bound (see bind_run) also go to a histogram labelled by run_id and stage, which lives only
+as long as the run. Other per-run series (users, events, rates, event-sink queue depth)
+are read from live run state by collectors when the endpoint is scraped, so they cost
+nothing between scrapes and vanish with the run.
+With METRICS_ENABLED off, `timed` returns the function undecorated and `count` is a no-op,
+so instrumented code runs exactly as it would without instrumentation.
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import METRICS_ENABLED
+
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, str, Dict[str, object], float]  # (name, type, labels, value)
+
+# The run whose hot path is executing. Each run drives its own thread and event loop, and
+# asyncio tasks copy the context, so one binding covers everything the run awaits.
+_current_run: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("converge_run", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Labels, Histogram] = defaultdict(Histogram)
+        self._run_histograms: Dict[int, Dict[str, Histogram]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def observe(self, stage: str, seconds: float) -> None:
+        run_id = _current_run.get()
+        with self._lock:
+            self._histograms[(("stage", stage),)].observe(seconds)
+            run = self._run_histograms.get(run_id) if run_id is not None else None
+            if run is not None:
+                if stage not in run:
+                    run[stage] = Histogram()
+                run[stage].observe(seconds)
+
+    def open_run(self, run_id: int) -> None:
+        with self._lock:
+            self._run_histograms.setdefault(run_id, {})
+
+    def close_run(self, run_id: int) -> None:
+        """Drop the run's stage series; late timings from its threads are then ignored."""
+        with self._lock:
+            self._run_histograms.pop(run_id, None)
+
+    def count(self, name: str, value: float = 1.0, **labels) -> None:
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            histograms = {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}
+            run_histograms = {
+                (("run_id", run_id), ("stage", stage)): (list(h.counts), h.sum, h.count)
+                for run_id, stages in self._run_histograms.items() for stage, h in stages.items()
+            }
+            counters = dict(self._counters)
+
+        _render_histograms(lines, "converge_stage_seconds",
+                           "Time spent in each instrumented hot-path stage.", histograms)
+        _render_histograms(lines, "converge_run_stage_seconds",
+                           "Time spent in each hot-path stage by active runs.", run_histograms)
+
+        by_name: Dict[str, list] = defaultdict(list)
+        for (metric, labels), value in counters.items():
+            by_name[metric].append(("counter", dict(labels), value))
+        for collector in self._collectors:
+            for metric, kind, labels, value in collector():
+                by_name[metric].append((kind, labels, value))
+        for metric in sorted(by_name):
+            samples = by_name[metric]
+            if metric in self._help:
+                lines.append(f"# HELP {metric} {self._help[metric]}")
+            lines.append(f"# TYPE {metric} {samples[0][0]}")
+            for _, labels, value in samples:
+                lines.append(f"{metric}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _render_histograms(lines: List[str], name: str, help_text: str,
+                       histograms: Dict[Labels, Tuple[List[int], float, int]]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, (counts, total, n) in sorted(histograms.items()):
+        cumulative = 0
+        for bound, c in zip(BUCKETS + (float("inf"),), counts):
+            cumulative += c
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(dict(labels), le=le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(dict(labels))} {total:.9f}")
+        lines.append(f"{name}_count{_labels(dict(labels))} {n}")
+
+
+def _labels(labels: Dict[str, object], **extra) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{str(v)}"' for k, v in labels.items())
+    return "{" + body + "}"
+
+
+REGISTRY = Registry()
+
+
+def timed(stage: str):
+    """Decorator recording each call's wall time under `stage`. Identity when metrics are off."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    REGISTRY.observe(stage, time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.observe(stage, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def bind_run(run_id: int) -> None:
+    """Attribute stage timings in the current context (thread, or the task and its
+    children) to run_id."""
+    _current_run.set(run_id)
+
+
+def _noop(*args, **kwargs) -> None:
+    pass
+
+
+count = REGISTRY.count if METRICS_ENABLED else _noop
+describe = REGISTRY.describe if METRICS_ENABLED else _noop
+register_collector = REGISTRY.register_collector if METRICS_ENABLED else _noop
+open_run = REGISTRY.open_run if METRICS_ENABLED else _noop
+close_run = REGISTRY.close_run if METRICS_ENABLED else _noop
+
+describe("converge_scorer_requests_total", "Claude scoring calls by outcome.")
+describe("converge_matrix_cache_lookups_total", "Conversion-matrix cache lookups by result.")
+describe("converge_events_written_total", "Events written to the database by all event sinks.")
@@ -0,0 +1,73 @@
+"""
+Persona sampling for simulated users.
+A run loads its personas once into a PersonaRegistry. Draws use a Walker/Vose alias table:
+O(n) to build, then O(1) per draw from a single uniform, whatever the number of personas.
+The table is rebuilt only when the population mix actually changes, and draws are
+vectorized, so a turbo batch gets thousands of persona indices in one call.
+"""
+from typing import Optional, Sequence
+
+import numpy as np
+
+from engine.rng import RunRNG, fallback_rng
+
+DEFAULT_PERSONA_WEIGHT = 0.2  # weight for personas the mix does not mention
+
+
+class AliasTable:
+    """Vose's alias method over fixed weights."""
+
+    def __init__(self, weights: Sequence[float]):
+        w = np.asarray(weights, dtype=np.float64)
+        n = len(w)
+        scaled = w * n / w.sum()
+        self.n = n
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # leftovers are 1.0 up to rounding and keep prob 1, alias self
+        self._prob_list = self.prob.tolist()  # plain lists for the scalar path
+        self._alias_list = self.alias.tolist()
+
+    def draw(self, rng: RunRNG, size=None):
+        """Indices in [0, n). One uniform per draw: its integer part picks the column,
+        its fractional part decides between the column and its alias."""
+        if size is None:
+            x = rng.random() * self.n
+            col = min(int(x), self.n - 1)
+            return col if x - col < self._prob_list[col] else self._alias_list[col]
+        x = rng.random(size) * self.n
+        col = np.minimum(np.asarray(x, dtype=np.int64), self.n - 1)
+        return np.where(x - col < self.prob[col], col, self.alias[col])
+
+
+class PersonaRegistry:
+    """A run's personas, loaded once, with an alias table for the current population mix."""
+
+    def __init__(self, personas):
+        self.personas = list(personas)
+        self.names = [p.name for p in self.personas]
+        self.ids = np.array([p.id for p in self.personas], dtype=np.int64)
+        self._mix_key = None
+        self._table: Optional[AliasTable] = None
+
+    def weights(self, population_mix: dict) -> np.ndarray:
+        return np.array([population_mix.get(n, DEFAULT_PERSONA_WEIGHT) for n in self.names], dtype=np.float64)
+
+    def table(self, population_mix: dict) -> AliasTable:
+        key = tuple(sorted(population_mix.items()))
+        if key != self._mix_key:
+            self._table = AliasTable(self.weights(population_mix))
+            self._mix_key = key
+        return self._table
+
+    def sample(self, population_mix: dict, rng: Optional[RunRNG] = None, size=None):
+        """Persona index (or array of indices when size is given) drawn under the mix."""
+        return self.table(population_mix).draw(rng or fallback_rng(), size)
@@ -0,0 +1,172 @@
+"""
+Monte Carlo replicates: R independent copies of one configuration, vectorized along a
+replicate axis. Every step's Beta posteriors are (R, K) arrays, so one Thompson draw, one
+conversion draw and one bincount update cover all replicates' users of a batch at once.
+Fixed-size chunks of replicates are spread over the sweep process pool and their per-replicate
+results are merged into distributions of regret, time-to-convergence and final allocation.
+"""
+import asyncio
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from config import REPLICATE_CHUNK
+from engine.conversion import ConversionMatrix
+from engine.personas import AliasTable, DEFAULT_PERSONA_WEIGHT
+from engine.rng import RunRNG
+from engine.sweep import get_pool
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def _arm_means(setup: dict, matrix: ConversionMatrix, population_mix: dict) -> Dict[int, np.ndarray]:
+    """Expected conversion rate of each variant under the population mix, per step."""
+    names = [p["name"] for p in setup["personas"]]
+    weights = np.array([population_mix.get(n, 0.2) for n in names], dtype=np.float64)
+    weights /= weights.sum()
+    rows = matrix.persona_indices(names)
+    return {
+        step_id: weights @ matrix.lookup(*np.ix_(rows, matrix.variant_indices(vids)))
+        for step_id, vids in setup["variants_by_step"].items()
+    }
+
+
+def run_replicate_chunk(setup: dict, config: dict, replicates: int, seed_seq: np.random.SeedSequence) -> dict:
+    """Run `replicates` independent copies of config. Executed inside a pool worker.
+    Returns per-replicate arrays; summarize_replicates turns them into distributions."""
+    rng = RunRNG(seed_seq)
+    steps = setup["steps"]
+    names = [p["name"] for p in setup["personas"]]
+    variants_by_step = setup["variants_by_step"]
+    variant_ids = [vid for ids in variants_by_step.values() for vid in ids]
+    matrix = ConversionMatrix.from_pairs(dict(setup["matrix"]), names, variant_ids)
+    persona_rows = matrix.persona_indices(names)
+    personas = AliasTable([config["population_mix"].get(n, DEFAULT_PERSONA_WEIGHT) for n in names])
+    means = _arm_means(setup, matrix, config["population_mix"])
+
+    R = replicates
+    total_users = config["total_users"]
+    batch_size = config["batch_size"]
+    noise = config["noise"]
+    alpha = {s["id"]: np.ones((R, len(variants_by_step[s["id"]]))) for s in steps}
+    beta = {s["id"]: np.ones((R, len(variants_by_step[s["id"]]))) for s in steps}
+    exposures = {s["id"]: np.zeros((R, len(variants_by_step[s["id"]])), dtype=np.int64) for s in steps}
+    best = {step_id: int(np.argmax(m)) for step_id, m in means.items()}
+    step_regret = {step_id: m.max() - m for step_id, m in means.items()}
+
+    checkpoints: List[int] = []
+    regret = np.zeros(R)
+    regret_curve = []  # cumulative regret per replicate at each checkpoint
+    correct_curve = []  # whether every step's posterior-mean leader is the true best arm
+
+    user_number = 0
+    while user_number < total_users:
+        n = min(batch_size, total_users - user_number)
+        persona_idx = personas.draw(rng, (R, n))
+        alive_r, alive_u = np.nonzero(np.ones((R, n), dtype=bool))
+        for step in steps:
+            if len(alive_r) == 0:
+                break
+            sid = step["id"]
+            a, b = alpha[sid], beta[sid]
+            k = a.shape[1]
+            if k == 0:
+                break
+            # Each surviving user gets a draw from their own replicate's posteriors
+            positions = np.argmax(rng.beta(a[alive_r], b[alive_r]), axis=1)
+            converted, _ = matrix.simulate(persona_rows[persona_idx[alive_r, alive_u]],
+                                           matrix.variant_indices(variants_by_step[sid])[positions], noise, rng)
+
+            flat = alive_r * k + positions
+            exp = np.bincount(flat, minlength=R * k).reshape(R, k)
+            conv = np.bincount(flat[converted], minlength=R * k).reshape(R, k)
+            exposures[sid] += exp
+            a += conv
+            b += exp - conv
+            regret += exp @ step_regret[sid]
+
+            alive_r, alive_u = alive_r[converted], alive_u[converted]
+        user_number += n
+
+        checkpoints.append(user_number)
+        regret_curve.append(regret.copy())
+        correct = np.ones(R, dtype=bool)
+        for sid, a in alpha.items():
+            if a.shape[1]:
+                correct &= np.argmax(a / (a + beta[sid]), axis=1) == best[sid]
+        correct_curve.append(correct)
+
+    correct_curve = np.array(correct_curve)  # (checkpoints, R)
+    # Converged at the first checkpoint after which the leader stays correct through the end
+    last_wrong = np.where(~correct_curve, np.arange(len(checkpoints))[:, None], -1).max(axis=0)
+    converged = last_wrong < len(checkpoints) - 1
+    convergence_users = np.where(
+        converged, np.array(checkpoints)[np.minimum(last_wrong + 1, len(checkpoints) - 1)], -1
+    )
+
+    allocation = np.concatenate(
+        [exposures[s["id"]] / np.maximum(exposures[s["id"]].sum(axis=1, keepdims=True), 1) for s in steps], axis=1
+    )
+    return {
+        "checkpoints": checkpoints,
+        "regret_curve": np.array(regret_curve).T,  # (R, checkpoints)
+        "convergence_users": convergence_users,
+        "allocation": allocation,  # (R, variants), share of each step's exposures
+        "variant_ids": [vid for s in steps for vid in variants_by_step[s["id"]]],
+        "best_variant_ids": [variants_by_step[s["id"]][best[s["id"]]] for s in steps if variants_by_step[s["id"]]],
+    }
+
+
+def _percentiles(values: np.ndarray) -> dict:
+    if values.size == 0:
+        return {}
+    return {f"p{q}": round(float(v), 4) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def summarize_replicates(chunks: List[dict]) -> dict:
+    """Merge chunk results into distributions over all replicates."""
+    first = chunks[0]
+    regret_curve = np.concatenate([c["regret_curve"] for c in chunks])
+    convergence = np.concatenate([c["convergence_users"] for c in chunks])
+    allocation = np.concatenate([c["allocation"] for c in chunks])
+    converged = convergence[convergence >= 0]
+    return {
+        "replicates": len(regret_curve),
+        "best_variant_ids": first["best_variant_ids"],
+        "regret": {
+            "final": {"mean": round(float(regret_curve[:, -1].mean()), 4), **_percentiles(regret_curve[:, -1])},
+            "curve": [
+                {"users": users, "mean": round(float(col.mean()), 4), **_percentiles(col)}
+                for users, col in zip(first["checkpoints"], regret_curve.T)
+            ],
+        },
+        "convergence": {
+            "converged_fraction": round(len(converged) / len(convergence), 4),
+            "users": {"mean": round(float(converged.mean()), 1), **_percentiles(converged)} if len(converged) else None,
+        },
+        "allocation": [
+            {"variant_id": vid, "mean": round(float(col.mean()), 4), **_percentiles(col)}
+            for vid, col in zip(first["variant_ids"], allocation.T)
+        ],
+    }
+
+
+async def run_replicates(setup: dict, config: dict, replicates: int, seed: int) -> dict:
+    """Split replicates into fixed-size chunks over the process pool and summarize them.
+    Each chunk runs on its own stream spawned from seed; chunk sizes do not depend on the
+    worker count, so a seed reproduces the same result on any machine."""
+    started = time.perf_counter()
+    sizes = [min(REPLICATE_CHUNK, replicates - i) for i in range(0, replicates, REPLICATE_CHUNK)]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(sizes))
+    pool = get_pool()
+    chunks = await asyncio.gather(*(
+        asyncio.wrap_future(pool.submit(run_replicate_chunk, setup, config, size, seed_seq))
+        for size, seed_seq in zip(sizes, seed_seqs)
+    ))
+    summary = summarize_replicates(list(chunks))
+    summary["config"] = config
+    summary["matrix_source"] = setup["matrix_source"]
+    summary["seed"] = seed
+    summary["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return summary
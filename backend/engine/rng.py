@@ -0,0 +1,67 @@
+"""
+Per-run random streams.
+Every run owns a RunRNG built on np.random.Generator(PCG64) and seeded from the run's seed,
+so a run can be replayed exactly. Independent consumers (simulation draws, bandit draws,
+metrics) and parallel workers or replicates each get a child stream spawned from the
+run's SeedSequence, so they never share state and the number of draws one of them makes
+never shifts another's sequence. Uniform draws are served from a prefetched block: the
+per-user path makes one generator call per RNG_PREFETCH draws instead of one per draw.
+"""
+import secrets
+import threading
+from typing import List, Union
+
+import numpy as np
+
+from config import RNG_PREFETCH
+
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+def new_seed() -> int:
+    """A fresh seed that fits a SQLite INTEGER, for runs started without one."""
+    return secrets.randbits(63)
+
+
+class RunRNG:
+    def __init__(self, seed: Seed = None, prefetch: int = RNG_PREFETCH):
+        self.seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.gen = np.random.Generator(np.random.PCG64(self.seed_seq))
+        self.prefetch = prefetch
+        self._buf = np.empty(0)
+        self._pos = 0
+
+    def spawn(self, n: int) -> List["RunRNG"]:
+        """n independent child streams; deterministic given this stream's seed and spawn order."""
+        return [RunRNG(s, self.prefetch) for s in self.seed_seq.spawn(n)]
+
+    def random(self, size=None):
+        """Uniform [0, 1). Scalars and small arrays are sliced out of the prefetch buffer."""
+        n = 1 if size is None else int(np.prod(size))
+        if n > self.prefetch:
+            return self.gen.random(size)
+        if self._pos + n > len(self._buf):
+            self._buf = self.gen.random(self.prefetch)  # a new block; earlier slices stay valid
+            self._pos = 0
+        start = self._pos
+        self._pos += n
+        if size is None:
+            return float(self._buf[start])
+        return self._buf[start:self._pos].reshape(size)
+
+    def uniform(self, low: float, high: float, size=None):
+        return low + (high - low) * self.random(size)
+
+    def beta(self, a, b, size=None):
+        return self.gen.beta(a, b, size)
+
+
+_local = threading.local()
+
+
+def fallback_rng() -> RunRNG:
+    """Unseeded per-thread stream for callers that were not handed one."""
+    rng = getattr(_local, "rng", None)
+    if rng is None:
+        rng = _local.rng = RunRNG()
+    return rng
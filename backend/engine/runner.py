@@ -0,0 +1,112 @@
+"""
+Background execution of simulation runs.
+Each run executes on its own worker thread with a private asyncio loop, so the blocking
+SQLAlchemy work and the simulation itself never run on the uvicorn event loop, and a run
+keeps going when its SSE client disconnects. Workers publish into the run's broadcaster
+(engine/broadcast.py), which every SSE subscriber of that run reads from.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from config import MAX_CONCURRENT_RUNS, RUN_RETAIN_SECONDS
+from engine.broadcast import RunBroadcaster
+from engine.simulation import run_simulation, get_run_state, register_run
+from engine.metrics import describe, register_collector
+
+
+class RunWorker:
+    def __init__(self, run_id: int):
+        self.run_id = run_id
+        self.broadcaster = RunBroadcaster()
+        self.finished = threading.Event()
+        self.finished_at: Optional[float] = None
+        self._thread = threading.Thread(target=self._main, name=f"run-{run_id}", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def _main(self) -> None:
+        asyncio.run(self._drive())
+
+    async def _drive(self) -> None:
+        try:
+            async for message in run_simulation(self.run_id):
+                self.broadcaster.publish(message)
+        except Exception as e:
+            print(f"[runner] run {self.run_id} failed: {e}")
+            self.broadcaster.publish({"type": "error", "message": f"Run failed: {e}"})
+        finally:
+            self.broadcaster.close()
+            self.finished_at = time.monotonic()
+            self.finished.set()
+
+
+class RunScheduler:
+    """Starts and tracks one worker per run, up to max_concurrent at a time."""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_RUNS):
+        self.max_concurrent = max_concurrent
+        self._workers: Dict[int, RunWorker] = {}
+        self._lock = threading.Lock()
+
+    def start(self, run_id: int) -> RunWorker:
+        """Start the run's worker, or return the existing one. Raises RuntimeError when at capacity."""
+        with self._lock:
+            self._reap()
+            worker = self._workers.get(run_id)
+            if worker is not None:
+                return worker
+            running = sum(not w.finished.is_set() for w in self._workers.values())
+            if running >= self.max_concurrent:
+                raise RuntimeError(f"{running} runs already active")
+            worker = RunWorker(run_id)
+            self._workers[run_id] = worker
+            register_run(run_id)  # controls work while the run is still setting up
+            worker.start()
+            return worker
+
+    def get(self, run_id: int) -> Optional[RunWorker]:
+        with self._lock:
+            self._reap()
+            return self._workers.get(run_id)
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Ask every active run to stop and wait briefly for final flushes."""
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            state = get_run_state(worker.run_id)
+            if state:
+                state["stopped"] = True
+        for worker in workers:
+            worker.join(timeout)
+
+    def _reap(self) -> None:
+        """Forget workers whose run ended more than RUN_RETAIN_SECONDS ago.
+        Until then, late or reconnecting subscribers can still read the tail of the run."""
+        now = time.monotonic()
+        for run_id, worker in list(self._workers.items()):
+            if worker.finished.is_set() and now - worker.finished_at > RUN_RETAIN_SECONDS:
+                del self._workers[run_id]
+
+
+scheduler = RunScheduler()
+
+
+def _collect_stream_metrics():
+    with scheduler._lock:
+        workers = list(scheduler._workers.values())
+    for worker in workers:
+        labels = {"run_id": worker.run_id}
+        yield "converge_stream_subscribers", "gauge", labels, worker.broadcaster.subscribers
+        yield "converge_stream_dropped_total", "counter", labels, worker.broadcaster.dropped
+
+
+register_collector(_collect_stream_metrics)
+describe("converge_stream_subscribers", "SSE clients currently reading the run's broadcaster.")
+describe("converge_stream_dropped_total", "Messages skipped by slow subscribers of the run.")
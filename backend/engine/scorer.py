@@ -1,12 +1,15 @@
 """
 Call Claude once at simulation start to generate a persona×variant conversion matrix.
-Returns a dict keyed by (persona_name, variant_id) -> probability.
+Returns a ConversionMatrix (engine/conversion.py) over personas × variants.
 Falls back to dot-product scoring if the API call fails.
+score_with_claude_async is the non-blocking variant runs use, so a run can start on the
+dot-product matrix and swap in Claude's when it arrives.
 """
+import asyncio
 import json
-import anthropic
-from config import ANTHROPIC_API_KEY
-from engine.conversion import compute_conversion_probability
+from config import ANTHROPIC_API_KEY, SCORER_MODEL, SCORER_TIMEOUT
+from engine.conversion import ConversionMatrix
+from engine.metrics import count, timed
 
 
 def build_scoring_prompt(personas, steps, variants):
@@ -59,47 +62,96 @@ Include one entry for every persona-variant combination ({len(personas) * len(va
     return prompt
 
 
-def generate_conversion_matrix(personas, steps, variants):
-    """Call Claude to generate persona×variant conversion probabilities.
-    Returns dict of (persona_name, variant_id) -> float probability."""
+def _parse_scores(text: str, personas, variants) -> ConversionMatrix:
+    text = text.strip()
+    # Handle potential markdown code fences
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1]
+        text = text.rsplit("```", 1)[0]
 
     matrix = {}
-
-    # Try Claude API
-    if ANTHROPIC_API_KEY:
-        try:
-            client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-            prompt = build_scoring_prompt(personas, steps, variants)
-
-            response = client.messages.create(
-                model="claude-haiku-4-5-20251001",
+    data = json.loads(text)
+    for entry in data["scores"]:
+        key = (entry["persona"], entry["variant_id"])
+        prob = max(0.05, min(0.55, float(entry["probability"])))
+        matrix[key] = prob
+    return ConversionMatrix.from_pairs(matrix, [p.name for p in personas], [v.id for v in variants])
+
+
+@timed("scorer_claude")
+def score_with_claude(personas, steps, variants):
+    """Ask Claude for the persona×variant matrix. Returns None if no key is set or the call fails."""
+    if not ANTHROPIC_API_KEY:
+        return None
+
+    try:
+        import anthropic  # deferred: the SDK is slow to import and unused without a key
+
+        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, timeout=SCORER_TIMEOUT)
+        response = client.messages.create(
+            model=SCORER_MODEL,
+            max_tokens=2048,
+            messages=[{"role": "user", "content": build_scoring_prompt(personas, steps, variants)}],
+        )
+        matrix = _parse_scores(response.content[0].text, personas, variants)
+        print(f"[scorer] Claude generated {len(matrix)} conversion scores")
+        count("converge_scorer_requests_total", outcome="ok")
+        return matrix
+
+    except Exception as e:
+        print(f"[scorer] Claude API failed ({e}), falling back to dot-product")
+        count("converge_scorer_requests_total", outcome="error")
+        return None
+
+
+@timed("scorer_claude")
+async def score_with_claude_async(personas, steps, variants):
+    """Non-blocking score_with_claude on the async client, with a hard SCORER_TIMEOUT.
+    Safe to await from the event loop; returns None on timeout or failure."""
+    if not ANTHROPIC_API_KEY:
+        return None
+
+    prompt = build_scoring_prompt(personas, steps, variants)
+    try:
+        import anthropic
+
+        client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        response = await asyncio.wait_for(
+            client.messages.create(
+                model=SCORER_MODEL,
                 max_tokens=2048,
                 messages=[{"role": "user", "content": prompt}],
-            )
-
-            text = response.content[0].text.strip()
-            # Handle potential markdown code fences
-            if text.startswith("```"):
-                text = text.split("\n", 1)[1]
-                text = text.rsplit("```", 1)[0]
-
-            data = json.loads(text)
-            for entry in data["scores"]:
-                key = (entry["persona"], entry["variant_id"])
-                prob = max(0.05, min(0.55, float(entry["probability"])))
-                matrix[key] = prob
-
-            print(f"[scorer] Claude generated {len(matrix)} conversion scores")
-            return matrix
-
-        except Exception as e:
-            print(f"[scorer] Claude API failed ({e}), falling back to dot-product")
-
-    # Fallback: dot-product scoring
-    for p in personas:
-        for v in variants:
-            prob = compute_conversion_probability(p.preferences, v.features)
-            matrix[(p.name, v.id)] = prob
+            ),
+            timeout=SCORER_TIMEOUT,
+        )
+        matrix = _parse_scores(response.content[0].text, personas, variants)
+        print(f"[scorer] Claude generated {len(matrix)} conversion scores")
+        count("converge_scorer_requests_total", outcome="ok")
+        return matrix
+
+    except asyncio.TimeoutError:
+        print(f"[scorer] Claude API timed out after {SCORER_TIMEOUT}s, staying on dot-product")
+        count("converge_scorer_requests_total", outcome="timeout")
+        return None
+    except Exception as e:
+        print(f"[scorer] Claude API failed ({e}), staying on dot-product")
+        count("converge_scorer_requests_total", outcome="error")
+        return None
+
+
+@timed("scorer_features")
+def score_with_features(personas, variants):
+    """Dot-product fallback scoring."""
+    matrix = ConversionMatrix.from_features(personas, variants)
 
     print(f"[scorer] Using dot-product fallback ({len(matrix)} scores)")
     return matrix
+
+
+def generate_conversion_matrix(personas, steps, variants):
+    """Call Claude to generate persona×variant conversion probabilities.
+    Returns a ConversionMatrix."""
+    matrix = score_with_claude(personas, steps, variants)
+    if matrix is not None:
+        return matrix
+    return score_with_features(personas, variants)
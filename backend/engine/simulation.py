@@ -1,19 +1,29 @@
 import asyncio
-import json
-import random
-from typing import AsyncGenerator, Dict, List
+import time
+from itertools import islice
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 
+import numpy as np
 from sqlalchemy.orm import Session
 
 from database import SessionLocal
 from models.persona import Persona
 from models.funnel_step import FunnelStep
 from models.variant import Variant
-from models.event import Event
 from models.simulation_run import SimulationRun
-from engine.bandit import thompson_select, update_bandit
-from engine.conversion import simulate_conversion_with_matrix
-from engine.scorer import generate_conversion_matrix
+from config import ANTHROPIC_API_KEY, BANDIT_CHECKPOINT_INTERVAL, ARCHIVE_FINISHED_RUNS
+from engine.bandit import BanditStore, load_bandit_store, thompson_select, update_bandit
+from engine.archive import archive_run
+from engine.event_sink import EventSink
+from engine.snapshots import SnapshotPolicy
+from engine.convergence import ConvergenceTracker
+from engine.personas import PersonaRegistry
+from engine.agent import AgentScheduler, apply_agent_result, score_hypotheses
+from engine.rng import RunRNG, fallback_rng
+from engine.metrics import timed, describe, register_collector, bind_run, open_run, close_run
+from engine.conversion import ConversionMatrix, simulate_conversion_with_matrix
+from engine import matrix_cache
+from engine.scorer import score_with_claude_async, score_with_features
 
 
 # Global simulation state per run
@@ -24,43 +34,71 @@ def get_run_state(run_id: int):
     return _active_runs.get(run_id)
 
 
-def _sample_persona(db: Session, population_mix: dict) -> Persona:
+def register_run(run_id: int) -> dict:
+    """Create the run's control state before its (slow) setup, so pause, resume, stop, speed
+    and population changes work from the moment the run is launched."""
+    state = _active_runs.get(run_id)
+    if state is None:
+        state = _active_runs[run_id] = {
+            "paused": False, "stopped": False, "speed": 5, "matrix": None, "bandit": None, "sink": None,
+            "user_number": 0, "started_at": time.monotonic(),
+            "population_mix": None,  # the run's own mix until set_population_mix replaces it
+        }
+    return state
+
+
+def _collect_run_metrics():
+    """Per-run series for /api/metrics, read from live run state at scrape time."""
+    now = time.monotonic()
+    yield "converge_active_runs", "gauge", {}, len(_active_runs)
+    for run_id, state in list(_active_runs.items()):
+        labels = {"run_id": run_id}
+        if state["sink"] is None:
+            continue  # still setting up
+        elapsed = max(now - state["started_at"], 1e-9)
+        users, events = state["user_number"], state["sink"].rows_written
+        yield "converge_run_users_total", "counter", labels, users
+        yield "converge_run_events_written_total", "counter", labels, events
+        yield "converge_run_users_per_second", "gauge", labels, users / elapsed
+        yield "converge_run_events_per_second", "gauge", labels, events / elapsed
+        yield "converge_run_sink_queue_depth", "gauge", labels, state["sink"].pending
+
+
+register_collector(_collect_run_metrics)
+describe("converge_active_runs", "Simulation runs currently executing.")
+describe("converge_run_users_total", "Users simulated so far in the run.")
+describe("converge_run_events_written_total", "Events the run's sink has written to the database.")
+describe("converge_run_users_per_second", "Average users simulated per second since the run started.")
+describe("converge_run_events_per_second", "Average events written per second since the run started.")
+describe("converge_run_sink_queue_depth", "Event batches waiting on the run's database writer.")
+
+
+@timed("sample_persona")
+def _sample_persona(registry: PersonaRegistry, population_mix: dict, rng: Optional[RunRNG] = None) -> Persona:
     """Sample a persona according to the population mix weights."""
-    personas = db.query(Persona).all()
-    names = [p.name for p in personas]
-    weights = [population_mix.get(p.name, 0.2) for p in personas]
-    total = sum(weights)
-    weights = [w / total for w in weights]
-    chosen_name = random.choices(names, weights=weights, k=1)[0]
-    return next(p for p in personas if p.name == chosen_name)
+    return registry.personas[registry.sample(population_mix, rng)]
 
 
-def simulate_user(db: Session, run: SimulationRun, user_number: int, matrix: dict) -> List[dict]:
+@timed("simulate_user")
+def simulate_user(
+    steps: List[FunnelStep], registry: PersonaRegistry, population_mix: dict, user_number: int,
+    matrix: ConversionMatrix, store: BanditStore, sink: EventSink, rng: Optional[RunRNG] = None,
+) -> List[dict]:
     """Simulate one user walking through the funnel using Claude-scored matrix."""
-    steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
-    persona = _sample_persona(db, run.population_mix)
+    persona = _sample_persona(registry, population_mix, rng)
     events = []
 
     for step in steps:
-        variant_id = thompson_select(db, step.id)
+        variant_id = thompson_select(store, step.id)
         if variant_id is None:
             break
 
         converted, match_score = simulate_conversion_with_matrix(
-            persona.name, variant_id, matrix
+            persona.name, variant_id, matrix, rng=rng
         )
-        update_bandit(db, variant_id, converted)
-
-        event = Event(
-            run_id=run.id,
-            user_number=user_number,
-            persona_id=persona.id,
-            step_id=step.id,
-            variant_id=variant_id,
-            converted=converted,
-            match_score=match_score,
-        )
-        db.add(event)
+        update_bandit(store, variant_id, converted)
+
+        sink.add(user_number, persona.id, step.id, variant_id, converted, match_score)
 
         events.append({
             "type": "user_event",
@@ -76,92 +114,266 @@ def simulate_user(db: Session, run: SimulationRun, user_number: int, matrix: dic
         if not converted:
             break  # user dropped off
 
-    db.commit()
     return events
 
 
+@timed("simulate_batch")
+def simulate_batch(
+    steps: List[FunnelStep],
+    registry: PersonaRegistry,
+    population_mix: dict,
+    matrix: ConversionMatrix,
+    store: BanditStore,
+    first_user: int,
+    n: int,
+    noise: float = 0.08,
+    rng: Optional[RunRNG] = None,
+) -> Tuple[Dict[str, np.ndarray], List[dict]]:
+    """Simulate n users at once. Each step does one matrix of Thompson draws for the users still
+    in the funnel, one array of conversion draws, and one aggregate bandit update.
+    Returns event columns ordered by (user_number, step) plus a per-step summary."""
+    rng = rng or fallback_rng()
+    persona_idx = registry.sample(population_mix, rng, size=n)
+    persona_ids = registry.ids
+    persona_rows = matrix.persona_indices(registry.names)
+
+    alive = np.arange(n)
+    chunks = []
+    summary = []
+    for step_number, step in enumerate(steps):
+        if len(alive) == 0:
+            break
+        positions = store.select_batch(step.id, len(alive))
+        if positions is None:
+            break
+
+        variant_cols = matrix.variant_indices(store.arms[step.id].variant_ids)
+        converted, probs = matrix.simulate(persona_rows[persona_idx[alive]], variant_cols[positions], noise, rng)
+        store.update_batch(step.id, positions, converted)
+
+        chunks.append((alive, step_number, step.id, store.arms[step.id].variant_ids[positions], converted, probs))
+        summary.append({
+            "step": step.step_number,
+            "step_name": step.name,
+            "exposures": int(len(alive)),
+            "conversions": int(converted.sum()),
+        })
+        alive = alive[converted]  # only survivors continue
+
+    if not chunks:
+        empty = np.empty(0, dtype=np.int64)
+        return {"user_number": empty, "persona_id": empty, "step_id": empty, "variant_id": empty,
+                "converted": np.empty(0, dtype=bool), "match_score": np.empty(0)}, summary
+
+    users = np.concatenate([c[0] for c in chunks])
+    order = np.lexsort((np.concatenate([np.full(len(c[0]), c[1]) for c in chunks]), users))
+    users = users[order]
+    columns = {
+        "user_number": users + first_user,
+        "persona_id": persona_ids[persona_idx[users]],
+        "step_id": np.concatenate([np.full(len(c[0]), c[2]) for c in chunks])[order],
+        "variant_id": np.concatenate([c[3] for c in chunks])[order],
+        "converted": np.concatenate([c[4] for c in chunks])[order],
+        "match_score": np.concatenate([c[5] for c in chunks])[order],
+    }
+    return columns, summary
+
+
+def _agent_tick(db: Session, run_id: int, agent: AgentScheduler, store: BanditStore, state: dict,
+                user_number: int) -> List[dict]:
+    """Start analyses that came due and apply the ones that finished. Never waits on the model."""
+    agent.trigger(store, user_number)
+    messages = []
+    for result in agent.completed():
+        state["matrix"], message = apply_agent_result(db, run_id, result, agent, store, state["matrix"])
+        messages.append(message)
+    return messages
+
+
+def _matrix_ready(matrix: ConversionMatrix, source: str, cache: str, cache_key: str, pending: bool = False,
+                  swapped_at: int = None) -> dict:
+    message = {
+        "type": "matrix_ready",
+        "pairs": len(matrix),
+        "source": source,  # claude | fallback
+        "cache": cache,  # hit | miss
+        "cache_key": cache_key[:12],
+        "pending": pending,  # a Claude matrix is still being generated
+        "sample": [
+            {"persona": k[0], "variant_id": k[1], "prob": round(v, 3)}
+            for k, v in islice(matrix.items(), 6)
+        ],
+    }
+    if swapped_at is not None:
+        message["swapped_at_user"] = swapped_at
+    return message
+
+
 async def run_simulation(run_id: int) -> AsyncGenerator[dict, None]:
-    """Main simulation loop. Yields dicts — sse-starlette handles framing."""
+    """Main simulation loop. Yields message dicts; engine/stream.py encodes them into SSE frames."""
     db = SessionLocal()
+    store = None
+    sink = None
+    scoring_task = None
+    agent = None
+    state = register_run(run_id)
+    open_run(run_id)
+    bind_run(run_id)  # this run owns the thread and loop driving it
     try:
         run = db.query(SimulationRun).get(run_id)
         if not run:
-            yield {"data": json.dumps({"type": "error", "message": "Run not found"})}
+            yield {"type": "error", "message": "Run not found"}
             return
 
         run.status = "running"
         db.commit()
 
-        # Generate conversion matrix via Claude (one API call)
         personas = db.query(Persona).all()
         steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
         variants = db.query(Variant).filter(Variant.is_active == True).all()
-
-        yield {"data": json.dumps({"type": "status", "message": "Generating conversion matrix via Claude..."})}
-
-        matrix = generate_conversion_matrix(personas, steps, variants)
-
-        yield {"data": json.dumps({
-            "type": "matrix_ready",
-            "pairs": len(matrix),
-            "sample": [
-                {"persona": k[0], "variant_id": k[1], "prob": round(v, 3)}
-                for k, v in list(matrix.items())[:6]
-            ],
-        })}
-
-        state = {"paused": False, "stopped": False, "speed": 5, "matrix": matrix}
-        _active_runs[run_id] = state
-
-        yield {"data": json.dumps({"type": "sim_started", "run_id": run_id})}
+        registry = PersonaRegistry(personas)
+
+        # Conversion matrix: cache hit, else start on the dot-product matrix right away and
+        # let Claude score in the background; its matrix is swapped in when it arrives.
+        matrix, cache_key = matrix_cache.cached_matrix(db, personas, steps, variants)
+        if matrix is not None:
+            yield _matrix_ready(matrix, "claude", "hit", cache_key)
+        else:
+            matrix = score_with_features(personas, variants)
+            if ANTHROPIC_API_KEY:
+                scoring_task = asyncio.create_task(score_with_claude_async(personas, steps, variants))
+                yield {"type": "status", "message": "Generating conversion matrix via Claude..."}
+            yield _matrix_ready(matrix, "fallback", "miss", cache_key, pending=scoring_task is not None)
+
+        # One seeded stream per run, split so simulation, bandit and metric draws stay independent
+        sim_rng, bandit_rng, metrics_rng = RunRNG(run.seed).spawn(3)
+        store = load_bandit_store(db, run_id=run.id, prior=run.prior, rng=bandit_rng)
+        sink = EventSink(run_id)
+        snapshots = SnapshotPolicy()
+        tracker = ConvergenceTracker(steps, [p.name for p in personas], run.convergence_every,
+                                     run.convergence_threshold, rng=metrics_rng)
+        agent = AgentScheduler(steps, personas, variants, store, run.agent_trigger_interval)
+        converged_at = None
+        state.update(matrix=matrix, bandit=store, sink=sink, started_at=time.monotonic())
+        if state["population_mix"] is None:
+            state["population_mix"] = dict(run.population_mix)
+
+        yield {"type": "sim_started", "run_id": run_id}
 
         user_number = 0
         while user_number < run.total_users:
             if state["stopped"]:
                 break
 
+            if scoring_task is not None and scoring_task.done():
+                claude_matrix = scoring_task.result()
+                scoring_task = None
+                if claude_matrix is not None:
+                    matrix_cache.store(db, cache_key, claude_matrix)
+                    matrix = state["matrix"] = agent.carry_over(claude_matrix, store)
+                    yield _matrix_ready(matrix, "claude", "miss", cache_key, swapped_at=user_number)
+                else:
+                    yield {"type": "matrix_error", "message": "Claude scoring unavailable, continuing on dot-product matrix"}
+
             if state["paused"]:
+                sink.flush_if_due()
                 await asyncio.sleep(0.1)
                 continue
 
-            user_number += 1
+            population_mix = state["population_mix"]
+            if run.mode == "turbo":
+                n = min(run.batch_size, run.total_users - user_number)
+                columns, summary = simulate_batch(
+                    steps, registry, population_mix, matrix, store, user_number + 1, n, rng=sim_rng
+                )
+                sink.add_columns(columns)
+                if (user_number + n) // BANDIT_CHECKPOINT_INTERVAL > user_number // BANDIT_CHECKPOINT_INTERVAL:
+                    store.checkpoint(db)
+                user_number += n
+                state["user_number"] = user_number
+
+                yield {
+                    "type": "batch_event",
+                    "user_number": user_number,
+                    "users": n,
+                    "events": int(len(columns["user_number"])),
+                    "steps": summary,
+                }
+                snapshot = snapshots.poll(store, user_number)
+                if snapshot:
+                    yield snapshot
+                metrics = tracker.poll(store, matrix, population_mix, user_number)
+                if metrics:
+                    yield metrics
+                    if run.auto_stop and metrics["converged"]:
+                        converged_at = user_number
+                        break
+                for message in _agent_tick(db, run_id, agent, store, state, user_number):
+                    yield message
+                matrix = state["matrix"]
+                await asyncio.sleep(0)  # let other streams run between ticks
+                continue
 
-            # Refresh run to pick up population_mix changes
-            db.refresh(run)
+            user_number += 1
+            state["user_number"] = user_number
 
-            events = simulate_user(db, run, user_number, matrix)
+            events = simulate_user(steps, registry, population_mix, user_number, matrix, store, sink, sim_rng)
             for event_data in events:
-                yield {"data": json.dumps(event_data)}
-
-            # Yield bandit state snapshot every user
-            from models.bandit_state import BanditState
-            bandit_states = db.query(BanditState).all()
-            snapshot = {
-                "type": "bandit_snapshot",
-                "user_number": user_number,
-                "states": [
-                    {
-                        "variant_id": bs.variant_id,
-                        "alpha": bs.alpha,
-                        "beta": bs.beta_param,
-                        "exposures": bs.exposures,
-                        "conversions": bs.conversions,
-                        "rate": round(bs.rate, 4),
-                    }
-                    for bs in bandit_states
-                ],
-            }
-            yield {"data": json.dumps(snapshot)}
+                yield event_data
+
+            if user_number % BANDIT_CHECKPOINT_INTERVAL == 0:
+                store.checkpoint(db)
+
+            snapshot = snapshots.poll(store, user_number)
+            if snapshot:
+                yield snapshot
+            metrics = tracker.poll(store, matrix, population_mix, user_number)
+            if metrics:
+                yield metrics
+                if run.auto_stop and metrics["converged"]:
+                    converged_at = user_number
+                    break
+            for message in _agent_tick(db, run_id, agent, store, state, user_number):
+                yield message
+            matrix = state["matrix"]
 
             # Throttle based on speed
             delay = 1.0 / state["speed"] if state["speed"] > 0 else 0.2
             await asyncio.sleep(delay)
 
-        run.status = "stopped" if state["stopped"] else "completed"
+        yield snapshots.poll(store, user_number, force=True)
+        metrics = tracker.poll(store, matrix, state["population_mix"], user_number, force=True)
+        if metrics:
+            yield metrics
+
+        sink.close()
+        agent.cancel()
+        score_hypotheses(db, run_id, store)
+        if converged_at is not None:
+            run.status = "converged"
+        else:
+            run.status = "stopped" if state["stopped"] else "completed"
         db.commit()
 
-        yield {"data": json.dumps({"type": "sim_ended", "run_id": run_id, "total_users": user_number})}
+        if ARCHIVE_FINISHED_RUNS:
+            archive_run(run_id)
+
+        yield {"type": "sim_ended", "run_id": run_id, "total_users": user_number, "converged_at": converged_at}
 
     finally:
         _active_runs.pop(run_id, None)
-        db.close()
+        if scoring_task is not None:
+            scoring_task.cancel()
+        if agent is not None:
+            agent.cancel()
+        try:
+            if sink is not None:
+                try:
+                    sink.close()  # guaranteed final flush, also on disconnect
+                except Exception as e:  # already surfaced by the loop; don't lose the checkpoint over it
+                    print(f"[simulation] run {run_id} event sink failed: {e}")
+            if store is not None:
+                store.checkpoint(db)  # final checkpoint, also on disconnect
+        finally:
+            db.close()
+            close_run(run_id)
@@ -0,0 +1,48 @@
+"""
+Coalescing policy for bandit_snapshot frames on the SSE stream.
+Snapshots go out at most every N users or T ms, whichever comes first, and carry only the
+variants whose posterior changed since the previous snapshot. Every Kth snapshot is a full
+keyframe so a client that joined late can rebuild the whole state.
+"""
+import time
+from typing import Optional
+
+from config import SNAPSHOT_EVERY_USERS, SNAPSHOT_INTERVAL_MS, SNAPSHOT_KEYFRAME_EVERY
+from engine.bandit import BanditStore
+
+
+class SnapshotPolicy:
+    def __init__(
+        self,
+        every_users: int = SNAPSHOT_EVERY_USERS,
+        interval_ms: float = SNAPSHOT_INTERVAL_MS,
+        keyframe_every: int = SNAPSHOT_KEYFRAME_EVERY,
+    ):
+        self.every_users = every_users
+        self.interval = interval_ms / 1000.0
+        self.keyframe_every = keyframe_every
+        self.emitted = 0
+        self._last_user = 0
+        self._last_time = time.monotonic()
+
+    def poll(self, store: BanditStore, user_number: int, force: bool = False) -> Optional[dict]:
+        """Return the next bandit_snapshot message if one is due, else None.
+        force emits a full keyframe regardless of cadence (e.g. at run end)."""
+        now = time.monotonic()
+        due = (
+            user_number - self._last_user >= self.every_users
+            or now - self._last_time >= self.interval
+        )
+        if not (due or force):
+            return None
+
+        full = force or self.emitted % self.keyframe_every == 0
+        states = store.snapshot(changed_only=not full)
+        if not states and not full:
+            return None  # nothing moved, keep coalescing
+
+        store.clear_dirty()
+        self.emitted += 1
+        self._last_user = user_number
+        self._last_time = now
+        return {"type": "bandit_snapshot", "user_number": user_number, "full": full, "states": states}
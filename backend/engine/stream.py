@@ -0,0 +1,124 @@
+"""
+SSE encoding for simulation streams.
+  json     one message per SSE frame (the original framing)
+  batch    many messages packed into one frame as a JSON array
+  compact  like batch, but user_event messages become positional arrays described by a
+           schema frame sent first, so field names are not repeated per event
+Batch size adapts to throughput: it targets STREAM_TARGET_FPS frames per second.
+Input is (id, message) frames from engine/broadcast.py; ids become SSE id: fields (a batch
+carries the id of its last message) so EventSource can resume with Last-Event-ID.
+"""
+import asyncio
+import time
+from typing import AsyncGenerator, AsyncIterator, List, Literal, Optional
+
+from config import STREAM_TARGET_FPS, STREAM_MAX_BATCH
+from engine.broadcast import Frame
+from engine.metrics import timed
+
+try:
+    import orjson
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+except ImportError:  # pragma: no cover — orjson is optional, stdlib json is the fallback
+    import json
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+
+StreamFormat = Literal["json", "batch", "compact"]
+
+USER_EVENT_SCHEMA = ["user_number", "persona", "step", "step_name", "variant_id", "converted", "match_score"]
+
+_END = object()
+
+
+async def encode_stream(frames: AsyncIterator[Frame], fmt: StreamFormat = "json") -> AsyncGenerator[dict, None]:
+    """Turn (id, message) frames into sse-starlette events in the requested format."""
+    if fmt == "json":
+        async for event_id, message in frames:
+            yield _sse(event_id, message)
+        return
+
+    compact = fmt == "compact"
+    if compact:
+        yield {"data": dumps({"type": "schema", "user_event": USER_EVENT_SCHEMA})}
+    async for batch in _batches(frames):
+        items = [_pack(m) for _, m in batch] if compact else [m for _, m in batch]
+        ids = [event_id for event_id, _ in batch if event_id is not None]
+        yield _sse(ids[-1] if ids else None, {"type": "batch", "items": items})
+
+
+@timed("sse_encode")
+def _sse(event_id: Optional[int], message: dict) -> dict:
+    event = {"data": dumps(message)}
+    if event_id is not None:
+        event["id"] = str(event_id)
+    return event
+
+
+def _pack(message: dict):
+    if message.get("type") != "user_event":
+        return message
+    return [message[f] for f in USER_EVENT_SCHEMA]
+
+
+async def _batches(frames: AsyncIterator[Frame]) -> AsyncGenerator[List[Frame], None]:
+    """Group frames so roughly STREAM_TARGET_FPS SSE events go out per second.
+    A pump task drains the producer into a bounded queue, so a quiet producer never holds back
+    a partially filled batch past one frame interval, and a slow client stalls the pump
+    (leaving the broadcaster to account for what it misses) instead of growing memory."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_MAX_BATCH)
+
+    async def pump():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except asyncio.CancelledError:
+            raise  # the consumer is gone; nobody is waiting for _END, and the queue may be full
+        except Exception:
+            await queue.put(_END)
+            raise
+        await queue.put(_END)
+
+    pump_task = asyncio.create_task(pump())
+    frame_interval = 1.0 / STREAM_TARGET_FPS
+    rate = 0.0  # messages/sec, exponentially smoothed
+    batch: List[Frame] = []
+    started = last_flush = time.monotonic()
+    try:
+        while True:
+            limit = max(1, min(STREAM_MAX_BATCH, int(rate * frame_interval)))
+            timeout = frame_interval - (time.monotonic() - started) if batch else None
+            try:
+                frame = await asyncio.wait_for(queue.get(), timeout) if timeout is None or timeout > 0 else None
+            except asyncio.TimeoutError:
+                frame = None
+
+            if frame is _END:
+                if batch:
+                    yield batch
+                return
+            if frame is not None:
+                if not batch:
+                    started = time.monotonic()
+                batch.append(frame)
+                if len(batch) < limit:
+                    continue
+
+            if batch:
+                now = time.monotonic()
+                rate = 0.8 * rate + 0.2 * (len(batch) / max(now - last_flush, 1e-4))
+                last_flush = now
+                yield batch
+                batch = []
+    finally:
+        pump_task.cancel()
+        try:
+            await pump_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        if hasattr(frames, "aclose"):
+            await frames.aclose()  # runs the producer's cleanup (e.g. broadcaster unsubscribe) now
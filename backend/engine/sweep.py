@@ -0,0 +1,171 @@
+"""
+Parameter sweeps: run many headless simulations in parallel across cores.
+The parent snapshots personas, steps, variants and the conversion matrix once as plain
+data; each configuration of the grid then runs in a process-pool worker that holds its
+own in-memory BanditStore and ConversionMatrix and drives the turbo batch loop, with no
+database or SSE in the path. Results are yielded as each configuration finishes.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import AsyncGenerator, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from config import SWEEP_MAX_WORKERS
+from models.persona import Persona
+from models.funnel_step import FunnelStep
+from models.variant import Variant
+from engine import matrix_cache
+from engine.bandit import BanditStore
+from engine.conversion import ConversionMatrix
+from engine.personas import PersonaRegistry
+from engine.rng import RunRNG
+from engine.scorer import score_with_features
+from engine.simulation import simulate_batch
+
+_pool: Optional[ProcessPoolExecutor] = None
+POOL_WORKERS = SWEEP_MAX_WORKERS or os.cpu_count() or 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """One shared pool, created on first use. spawn avoids forking the server's threads."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def load_setup(db: Session) -> dict:
+    """Picklable snapshot of everything a headless run needs.
+    Uses the cached Claude matrix when there is one; sweeps never call the API themselves."""
+    personas = db.query(Persona).all()
+    steps = db.query(FunnelStep).order_by(FunnelStep.step_number).all()
+    variants = db.query(Variant).filter(Variant.is_active == True).all()
+    matrix, _ = matrix_cache.cached_matrix(db, personas, steps, variants, touch=False)  # don't count sweeps as hits
+    source = "claude_cached"
+    if matrix is None:
+        matrix = score_with_features(personas, variants)
+        source = "features"
+    return {
+        "personas": [{"id": p.id, "name": p.name} for p in personas],
+        "steps": [{"id": s.id, "step_number": s.step_number, "name": s.name} for s in steps],
+        "variants_by_step": {s.id: [v.id for v in variants if v.step_id == s.id] for s in steps},
+        "matrix": list(matrix.items()),
+        "matrix_source": source,
+    }
+
+
+def expand_grid(grid: Dict[str, list]) -> List[dict]:
+    """Cartesian product of the grid's value lists, in a stable order."""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_headless(setup: dict, config: dict, seed_seq: np.random.SeedSequence) -> dict:
+    """Run one configuration start to finish in memory. Executed inside a pool worker."""
+    started = time.perf_counter()
+    sim_rng, bandit_rng = RunRNG(seed_seq).spawn(2)
+    registry = PersonaRegistry(SimpleNamespace(**p) for p in setup["personas"])
+    steps = [SimpleNamespace(**s) for s in setup["steps"]]
+    variant_ids = [vid for ids in setup["variants_by_step"].values() for vid in ids]
+    matrix = ConversionMatrix.from_pairs(dict(setup["matrix"]), registry.names, variant_ids)
+    store = BanditStore.fresh(setup["variants_by_step"], rng=bandit_rng)
+
+    total_users = config["total_users"]
+    batch_size = config.get("batch_size", 1000)
+    user_number = 0
+    events = 0
+    completed = 0  # users who converted at the last step
+    while user_number < total_users:
+        n = min(batch_size, total_users - user_number)
+        columns, summary = simulate_batch(
+            steps, registry, config["population_mix"], matrix, store, user_number + 1, n, config["noise"], sim_rng
+        )
+        events += len(columns["user_number"])
+        if len(summary) == len(steps):
+            completed += summary[-1]["conversions"]
+        user_number += n
+
+    elapsed = time.perf_counter() - started
+    step_results = []
+    for step in steps:
+        a = store.arms[step.id]
+        posterior_mean = a.alpha / (a.alpha + a.beta)
+        step_results.append({
+            "step": step.step_number,
+            "step_name": step.name,
+            "best_variant_id": int(a.variant_ids[int(np.argmax(posterior_mean))]),
+            "variants": [
+                {
+                    "variant_id": int(a.variant_ids[i]),
+                    "exposures": int(a.exposures[i]),
+                    "conversions": int(a.conversions[i]),
+                    "rate": round(int(a.conversions[i]) / int(a.exposures[i]), 4) if a.exposures[i] else 0.0,
+                    "allocation": round(int(a.exposures[i]) / max(int(a.exposures.sum()), 1), 4),
+                }
+                for i in range(len(a.variant_ids))
+            ],
+        })
+    return {
+        "users": user_number,
+        "events": events,
+        "end_to_end_rate": round(completed / user_number, 4) if user_number else 0.0,
+        "elapsed_sec": round(elapsed, 3),
+        "users_per_sec": round(user_number / elapsed, 1) if elapsed > 0 else None,
+        "steps": step_results,
+    }
+
+
+async def run_sweep(setup: dict, configs: List[dict], seed: int) -> AsyncGenerator[dict, None]:
+    """Fan configs out over the process pool; yield sweep messages as each one completes.
+    Config i always runs on the i-th stream spawned from seed, whatever worker picks it up."""
+    started = time.perf_counter()
+    pool = get_pool()
+    yield {
+        "type": "sweep_started",
+        "configs": len(configs),
+        "workers": POOL_WORKERS,
+        "matrix_source": setup["matrix_source"],
+        "seed": seed,
+    }
+
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(configs))
+    futures = [
+        asyncio.wrap_future(pool.submit(run_headless, setup, config, seed_seq))
+        for config, seed_seq in zip(configs, seed_seqs)
+    ]
+
+    async def indexed(i: int):
+        try:
+            return i, await futures[i], None
+        except Exception as e:
+            return i, None, e
+
+    try:
+        for done in asyncio.as_completed([indexed(i) for i in range(len(futures))]):
+            index, result, error = await done
+            if error is not None:
+                yield {"type": "sweep_error", "index": index, "config": configs[index], "message": str(error)}
+            else:
+                yield {"type": "sweep_result", "index": index, "config": configs[index], "result": result}
+    finally:
+        for f in futures:
+            f.cancel()
+
+    yield {"type": "sweep_ended", "configs": len(configs), "elapsed_sec": round(time.perf_counter() - started, 3)}
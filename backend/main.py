@@ -1,20 +1,44 @@
-from contextlib import asynccontextmanager
+import time
+
+_started = time.perf_counter()  # before the imports below, so the startup report includes them
+
+from contextlib import asynccontextmanager, contextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import Base, engine
+from database import migrate_schema
 from seed import seed_database
 import models  # noqa: F401 — registers all models with SQLAlchemy
+from engine.runner import scheduler
+from engine.sweep import shutdown_pool
 from api.simulation import router as simulation_router
 from api.data import router as data_router
+from api.admin import router as admin_router
+from api.metrics import router as metrics_router
+
+# Seconds spent in each startup phase, logged once and served by /api/health
+startup_report = {"imports": round(time.perf_counter() - _started, 4)}
+
+
+@contextmanager
+def _phase(name: str):
+    started = time.perf_counter()
+    yield
+    startup_report[name] = round(time.perf_counter() - started, 4)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
-    seed_database()
+    with _phase("migrate_schema"):
+        migrate_schema()
+    with _phase("seed"):
+        seed_database()
+    startup_report["total"] = round(time.perf_counter() - _started, 4)
+    print("[startup] " + ", ".join(f"{phase} {sec * 1000:.0f} ms" for phase, sec in startup_report.items()))
     yield
+    scheduler.shutdown()
+    shutdown_pool()
 
 
 app = FastAPI(title="Converge", lifespan=lifespan)
@@ -30,8 +54,10 @@ app.add_middleware(
 
 app.include_router(simulation_router)
 app.include_router(data_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
 
 
 @app.get("/api/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "startup": startup_report}
@@ -2,16 +2,22 @@ from models.persona import Persona
 from models.funnel_step import FunnelStep
 from models.variant import Variant
 from models.bandit_state import BanditState
+from models.run_bandit_state import RunBanditState
 from models.event import Event
 from models.simulation_run import SimulationRun
 from models.hypothesis import Hypothesis
+from models.run_rollup import RunRollup
+from models.matrix_cache import MatrixCacheEntry
 
 __all__ = [
     "Persona",
     "FunnelStep",
     "Variant",
     "BanditState",
+    "RunBanditState",
     "Event",
     "SimulationRun",
     "Hypothesis",
+    "RunRollup",
+    "MatrixCacheEntry",
 ]
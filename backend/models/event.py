@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, Float, Boolean, ForeignKey
+from sqlalchemy import Integer, Float, Boolean, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 
 from database import Base
@@ -6,6 +6,10 @@ from database import Base
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_run_id_id", "run_id", "id"),
+        Index("ix_events_run_step_variant", "run_id", "step_id", "variant_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     run_id: Mapped[int] = mapped_column(Integer, ForeignKey("simulation_runs.id"), nullable=False)
@@ -0,0 +1,16 @@
+from sqlalchemy import Integer, String, Float, JSON
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class MatrixCacheEntry(Base):
+    __tablename__ = "matrix_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    key: Mapped[str] = mapped_column(String, unique=True, nullable=False)
+    model: Mapped[str] = mapped_column(String, nullable=False)
+    scores: Mapped[list] = mapped_column(JSON, nullable=False)  # [[persona_name, variant_id, prob], ...]
+    created_at: Mapped[float] = mapped_column(Float, nullable=False)  # unix time
+    last_used_at: Mapped[float] = mapped_column(Float, nullable=False)
+    hits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -0,0 +1,20 @@
+from sqlalchemy import Integer, Float, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class RunBanditState(Base):
+    __tablename__ = "run_bandit_states"
+    __table_args__ = (
+        UniqueConstraint("run_id", "variant_id", name="uq_run_bandit_states_key"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    run_id: Mapped[int] = mapped_column(Integer, ForeignKey("simulation_runs.id"), nullable=False)
+    variant_id: Mapped[int] = mapped_column(Integer, ForeignKey("variants.id"), nullable=False)
+    alpha: Mapped[float] = mapped_column(Float, nullable=False, default=1.0)
+    beta_param: Mapped[float] = mapped_column(Float, nullable=False, default=1.0)
+    exposures: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    conversions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rate: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
@@ -0,0 +1,19 @@
+from sqlalchemy import Integer, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class RunRollup(Base):
+    __tablename__ = "run_rollups"
+    __table_args__ = (
+        UniqueConstraint("run_id", "step_id", "variant_id", "persona_id", name="uq_run_rollups_key"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    run_id: Mapped[int] = mapped_column(Integer, ForeignKey("simulation_runs.id"), nullable=False)
+    step_id: Mapped[int] = mapped_column(Integer, ForeignKey("funnel_steps.id"), nullable=False)
+    variant_id: Mapped[int] = mapped_column(Integer, ForeignKey("variants.id"), nullable=False)
+    persona_id: Mapped[int] = mapped_column(Integer, ForeignKey("personas.id"), nullable=False)
+    exposures: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    conversions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
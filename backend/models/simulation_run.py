@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, JSON
+from sqlalchemy import Integer, Float, String, Boolean, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 
 from database import Base
@@ -12,3 +12,11 @@ class SimulationRun(Base):
     total_users: Mapped[int] = mapped_column(Integer, nullable=False, default=500)
     population_mix: Mapped[dict] = mapped_column(JSON, nullable=False)
     agent_trigger_interval: Mapped[int] = mapped_column(Integer, nullable=False, default=100)
+    mode: Mapped[str] = mapped_column(String, nullable=False, default="stream")  # stream | turbo
+    batch_size: Mapped[int] = mapped_column(Integer, nullable=False, default=1000)
+    prior: Mapped[str] = mapped_column(String, nullable=False, default="global")  # global | fresh
+    promoted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    convergence_every: Mapped[int] = mapped_column(Integer, nullable=False, default=100)
+    convergence_threshold: Mapped[float] = mapped_column(Float, nullable=False, default=0.95)
+    auto_stop: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    seed: Mapped[int] = mapped_column(Integer, nullable=True)  # RNG seed, recorded so the run can be replayed
@@ -1,3 +1,5 @@
+from sqlalchemy import insert, select
+
 from database import SessionLocal
 from models.persona import Persona
 from models.funnel_step import FunnelStep
@@ -9,33 +11,29 @@ from seed.variants import VARIANTS
 
 
 def seed_database():
+    """Insert the starter personas, funnel steps, variants and bandit states in one transaction,
+    one bulk insert per table. The tables start empty, so ids are read back with a single
+    query instead of a flush per row."""
     db = SessionLocal()
     try:
-        if db.query(Persona).count() > 0:
+        if db.query(Persona.id).first() is not None:
             return  # already seeded
 
-        # Personas
-        for p in PERSONAS:
-            db.add(Persona(name=p["name"], description=p["description"], preferences=p["preferences"]))
-        db.flush()
-
-        # Funnel steps
-        for s in FUNNEL_STEPS:
-            db.add(FunnelStep(step_number=s["step_number"], name=s["name"], description=s["description"]))
-        db.flush()
+        db.execute(insert(Persona), PERSONAS)
+        db.execute(insert(FunnelStep), FUNNEL_STEPS)
+        step_map = dict(db.query(FunnelStep.step_number, FunnelStep.id).all())
 
-        # Variants + bandit states
-        step_map = {s.step_number: s.id for s in db.query(FunnelStep).all()}
-        for v in VARIANTS:
-            variant = Variant(
-                step_id=step_map[v["step_number"]],
-                generation=v["generation"],
-                content=v["content"],
-                features=v["features"],
-            )
-            db.add(variant)
-            db.flush()
-            db.add(BanditState(variant_id=variant.id))
+        db.execute(insert(Variant), [
+            {
+                "step_id": step_map[v["step_number"]],
+                "generation": v["generation"],
+                "content": v["content"],
+                "features": v["features"],
+            }
+            for v in VARIANTS
+        ])
+        variant_ids = db.scalars(select(Variant.id)).all()
+        db.execute(insert(BanditState), [{"variant_id": vid} for vid in variant_ids])
 
         db.commit()
     finally:
@@ -7,7 +7,9 @@ export default function useSimulation() {
   const [userCount, setUserCount] = useState(0);
   const [events, setEvents] = useState([]);
   const [banditStates, setBanditStates] = useState([]);
-  const [variants] = useState([]);
+  const [convergence, setConvergence] = useState(null);
+  const [hypotheses, setHypotheses] = useState([]);
+  const [variants, setVariants] = useState([]);
   const sourceRef = useRef(null);
 
   const handleMessage = useCallback((data) => {
@@ -24,9 +26,27 @@ export default function useSimulation() {
         setUserCount(data.user_number);
         break;
       case 'bandit_snapshot':
-        setBanditStates(data.states);
+        // Keyframes (full !== false) replace everything; deltas only carry changed variants
+        if (data.full === false) {
+          setBanditStates((prev) => {
+            const byId = new Map(prev.map((s) => [s.variant_id, s]));
+            for (const s of data.states) byId.set(s.variant_id, s);
+            return [...byId.values()];
+          });
+        } else {
+          setBanditStates(data.states);
+        }
         setUserCount(data.user_number);
         break;
+      case 'convergence':
+        // Regret and per-step probability-of-best, at the run's convergence cadence
+        setConvergence(data);
+        break;
+      case 'hypothesis':
+        // Agent analysis finished; its variants are already live in the bandit
+        setHypotheses((prev) => [...prev, data]);
+        setVariants((prev) => [...prev, ...data.variants.map((v) => ({ ...v, step: data.step }))]);
+        break;
       case 'sim_ended':
         setStatus('completed');
         if (sourceRef.current) sourceRef.current.close();
@@ -43,6 +63,9 @@ export default function useSimulation() {
 
     setEvents([]);
     setBanditStates([]);
+    setConvergence(null);
+    setHypotheses([]);
+    setVariants([]);
     setUserCount(0);
     setStatus('starting');
 
@@ -102,6 +125,8 @@ export default function useSimulation() {
     userCount,
     events,
     banditStates,
+    convergence,
+    hypotheses,
     start,
     pause,
     resume,
@@ -25,14 +25,30 @@ export function patch(path, body) {
   return fetchJSON(path, { method: 'PATCH', body: JSON.stringify(body) });
 }
 
-export function connectSSE(runId, onMessage) {
-  const url = `${BASE}/simulation/${runId}/stream`;
+// "compact" packs many messages per frame and sends user_events as positional
+// arrays described by a leading schema frame. "json" is one message per frame.
+export function connectSSE(runId, onMessage, format = 'compact') {
+  const url = `${BASE}/simulation/${runId}/stream?format=${format}`;
   const source = new EventSource(url);
+  let userEventFields = null;
+
+  const unpack = (item) => {
+    if (!Array.isArray(item)) return item;
+    const msg = { type: 'user_event' };
+    userEventFields.forEach((field, i) => { msg[field] = item[i]; });
+    return msg;
+  };
 
   source.onmessage = (e) => {
     try {
       const data = JSON.parse(e.data);
-      onMessage(data);
+      if (data.type === 'schema') {
+        userEventFields = data.user_event;
+      } else if (data.type === 'batch') {
+        for (const item of data.items) onMessage(unpack(item));
+      } else {
+        onMessage(data);
+      }
     } catch (err) {
       console.warn('[SSE] parse error:', err, e.data);
     }